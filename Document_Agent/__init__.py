@@ -10,17 +10,37 @@ Gauz Document Agent - 智能速率控制增强版
 版本：v2.0 - 智能速率控制增强版
 """
 
-# 导入增强版本的Agent类
-from .orchestrator_agent.agent import EnhancedOrchestratorAgent
-from .section_writer_agent.react_agent import EnhancedReactAgent
-from .content_generator_agent.main_generator import EnhancedMainDocumentGenerator
-from .common.performance_monitor import DocumentAgentPerformanceMonitor
-from .common.advanced_rate_limiter import DocumentAgentRateLimiter
-
-# 向后兼容性别名（确保现有代码不会中断）
-OrchestratorAgent = EnhancedOrchestratorAgent
-ReactAgent = EnhancedReactAgent  
-MainDocumentGenerator = EnhancedMainDocumentGenerator
+import importlib
+
+# 延迟导入：包内各Agent依赖较重（HTTP客户端、并发管理器等），只在首次访问对应名称时才加载，
+# 这样只使用某个子模块（如 Document_Agent.common.file_utils）时不会连带导入全部Agent
+_LAZY_EXPORTS = {
+    'EnhancedOrchestratorAgent': ('.orchestrator_agent.agent', 'EnhancedOrchestratorAgent'),
+    'EnhancedReactAgent': ('.section_writer_agent.react_agent', 'EnhancedReactAgent'),
+    'EnhancedMainDocumentGenerator': ('.content_generator_agent.main_generator', 'EnhancedMainDocumentGenerator'),
+    'DocumentAgentPerformanceMonitor': ('.common.performance_monitor', 'DocumentAgentPerformanceMonitor'),
+    'DocumentAgentRateLimiter': ('.common.advanced_rate_limiter', 'DocumentAgentRateLimiter'),
+    
+    # 向后兼容性别名（确保现有代码不会中断）
+    'OrchestratorAgent': ('.orchestrator_agent.agent', 'EnhancedOrchestratorAgent'),
+    'ReactAgent': ('.section_writer_agent.react_agent', 'EnhancedReactAgent'),
+    'MainDocumentGenerator': ('.content_generator_agent.main_generator', 'EnhancedMainDocumentGenerator'),
+}
+
+
+def __getattr__(name):
+    """按需导入导出的类，并缓存到模块命名空间，之后的访问不再经过这里"""
+    try:
+        module_name, attr_name = _LAZY_EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name, __name__), attr_name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 # 导出所有主要类
 __all__ = [
@@ -9,9 +9,11 @@ from .data_structures import (
     CollectionPlan, CollectedInfo, PerfectContext, GeneratedSection,
     GenerationMetrics
 )
+from .file_utils import write_text_atomic, write_json_atomic, read_json
 
 __all__ = [
     'InfoType', 'DocType', 'SectionSpec', 'DocumentPlan', 'QueryGroup',
     'CollectionPlan', 'CollectedInfo', 'PerfectContext', 'GeneratedSection',
-    'GenerationMetrics'
+    'GenerationMetrics', 'write_text_atomic', 'write_json_atomic',
+    'read_json'
 ] 
\ No newline at end of file
@@ -10,9 +10,8 @@ import threading
 import logging
 from collections import deque, defaultdict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional
 from enum import Enum
-import statistics
 import json
 
 class ErrorType(Enum):
@@ -24,8 +23,7 @@ class ErrorType(Enum):
     CLIENT_ERROR = "client_error"   # 4xx - 客户端错误
     UNKNOWN = "unknown"            # 未知错误
 
-@dataclass
-class RequestRecord:
+class RequestRecord(NamedTuple):
     """请求记录"""
     timestamp: float
     success: bool
@@ -84,6 +82,7 @@ class DocumentAgentRateLimiter:
         
         # 请求历史记录（滑动窗口）
         self.request_history = deque(maxlen=window_size)
+        self._history_successes = 0  # 滑动窗口内的成功数，随追加/淘汰增量维护
         
         # 时间窗口统计
         self.time_window_records = deque()
@@ -170,8 +169,12 @@ class DocumentAgentRateLimiter:
                 agent_type=self.agent_type
             )
             
-            # 添加到历史记录
+            # 添加到历史记录（窗口已满时，append会淘汰最旧的记录，同步扣减成功数）
+            if len(self.request_history) == self.request_history.maxlen and self.request_history[0].success:
+                self._history_successes -= 1
             self.request_history.append(record)
+            if success:
+                self._history_successes += 1
             self.time_window_records.append(record)
             
             # 更新连续计数
@@ -267,12 +270,17 @@ class DocumentAgentRateLimiter:
             deficit = target_rate - success_rate
             return 0.6 * min(1.0, deficit / 0.3)
 
+    def _recent_records(self, count: int) -> List[RequestRecord]:
+        """取最近count条请求记录（按时间顺序）；只按下标访问deque两端，不复制整个历史"""
+        history = self.request_history
+        return [history[i] for i in range(-min(count, len(history)), 0)]
+
     def _calculate_error_type_adjustment(self) -> float:
         """基于错误类型计算调整系数 - 文档生成优化版"""
         if not self.request_history:
             return 0.0
         
-        recent_errors = [r for r in list(self.request_history)[-20:] if not r.success]
+        recent_errors = [r for r in self._recent_records(20) if not r.success]
         if not recent_errors:
             return 0.0
         
@@ -300,8 +308,9 @@ class DocumentAgentRateLimiter:
         if len(self.response_times) < 5:
             return 0.0
         
-        avg_response_time = statistics.mean(self.response_times)
-        recent_response_time = statistics.mean(list(self.response_times)[-5:])
+        response_times = self.response_times
+        avg_response_time = sum(response_times) / len(response_times)
+        recent_response_time = sum(response_times[i] for i in range(-5, 0)) / 5
         
         # 文档生成系统的响应时间阈值调整
         slow_threshold_multiplier = 2.0  # 2倍平均时间视为慢
@@ -336,7 +345,7 @@ class DocumentAgentRateLimiter:
         if len(self.request_history) < 10:
             return 0.0
         
-        recent_records = list(self.request_history)[-10:]
+        recent_records = self._recent_records(10)
         first_half_success = sum(1 for r in recent_records[:5] if r.success) / 5
         second_half_success = sum(1 for r in recent_records[5:] if r.success) / 5
         
@@ -378,7 +387,7 @@ class DocumentAgentRateLimiter:
             return 1.0
         
         recent_count = min(15, len(self.request_history))  # 文档生成使用较小窗口
-        recent_records = list(self.request_history)[-recent_count:]
+        recent_records = self._recent_records(recent_count)
         successes = sum(1 for r in recent_records if r.success)
         
         return successes / recent_count
@@ -394,14 +403,14 @@ class DocumentAgentRateLimiter:
     def _update_stats(self):
         """更新统计信息"""
         self.stats.total_requests = len(self.request_history)
-        self.stats.successful_requests = sum(1 for r in self.request_history if r.success)
+        self.stats.successful_requests = self._history_successes
         self.stats.failed_requests = self.stats.total_requests - self.stats.successful_requests
         
         if self.stats.total_requests > 0:
             self.stats.success_rate = self.stats.successful_requests / self.stats.total_requests
         
         if self.response_times:
-            self.stats.avg_response_time = statistics.mean(self.response_times)
+            self.stats.avg_response_time = sum(self.response_times) / len(self.response_times)
         
         # 错误分类统计
         self.stats.error_breakdown = dict(self.error_counts)
@@ -423,8 +432,9 @@ class DocumentAgentRateLimiter:
             # 计算趋势
             trend = "stable"
             if len(self.request_history) >= 10:
-                old_success = sum(1 for r in list(self.request_history)[-10:-5] if r.success) / 5
-                new_success = sum(1 for r in list(self.request_history)[-5:] if r.success) / 5
+                recent_records = self._recent_records(10)
+                old_success = sum(1 for r in recent_records[:5] if r.success) / 5
+                new_success = sum(1 for r in recent_records[5:] if r.success) / 5
                 diff = new_success - old_success
                 
                 if diff > 0.1:
@@ -482,7 +492,7 @@ class DocumentAgentRateLimiter:
             recommendations.append("延迟时间过长，检查API服务性能")
             
         if len(self.response_times) > 8:
-            avg_response = statistics.mean(self.response_times)
+            avg_response = sum(self.response_times) / len(self.response_times)
             if avg_response > 15:  # 文档生成允许更长响应时间
                 recommendations.append("响应时间过长，考虑优化请求内容或检查网络")
         
@@ -500,6 +510,7 @@ class DocumentAgentRateLimiter:
             self.current_delay = self.base_delay
             self.adaptive_factor = 1.0
             self.request_history.clear()
+            self._history_successes = 0
             self.time_window_records.clear()
             self.error_counts.clear()
             self.consecutive_errors = 0
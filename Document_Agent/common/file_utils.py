@@ -0,0 +1,82 @@
+"""
+文件工具函数
+
+提供原子化的文件写入：先写入同目录下的临时文件，再用os.replace替换目标文件，
+进程在写入中途被终止时，目标文件要么是旧内容，要么是完整的新内容，不会出现截断的半成品。
+"""
+
+import json
+import os
+import threading
+from typing import Any
+
+try:
+    import orjson  # 可选依赖：阶段结果JSON较大，orjson读写都明显快于标准库
+except ImportError:
+    orjson = None
+
+
+def write_text_atomic(file_path: str, content: str, encoding: str = 'utf-8') -> None:
+    """
+    原子化写入文本文件
+
+    Args:
+        file_path: 目标文件路径
+        content: 要写入的文本内容
+        encoding: 文件编码
+    """
+    # 临时文件与目标文件放在同一目录（同一文件系统），os.replace才是原子操作；
+    # 文件名带上进程和线程标识，避免并发写同一目标时互相覆盖临时文件
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding=encoding) as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(file_path: str, data: Any, indent: int = 2) -> str:
+    """
+    原子化写入JSON文件（保留中文，不转义）
+
+    Args:
+        file_path: 目标文件路径
+        data: 可JSON序列化的数据
+        indent: 缩进空格数
+
+    Returns:
+        str: 写入的JSON文本，便于调用方复用同一份序列化结果
+    """
+    content = None
+    if orjson is not None and indent == 2:
+        try:
+            # orjson默认输出UTF-8（不转义中文），OPT_INDENT_2的格式与json.dumps(indent=2)一致
+            content = orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            content = None  # orjson不支持的类型（如非字符串键）回退到标准库
+    if content is None:
+        content = json.dumps(data, ensure_ascii=False, indent=indent)
+    write_text_atomic(file_path, content)
+    return content
+
+
+def read_json(file_path: str) -> Any:
+    """
+    读取JSON文件（有orjson时直接解析UTF-8字节，否则使用标准库）
+
+    Args:
+        file_path: JSON文件路径
+
+    Returns:
+        Any: 解析后的数据
+    """
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -8,7 +8,7 @@ Document_Agent 性能监控系统
 import time
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List
 from datetime import datetime
 from dataclasses import dataclass, field
 
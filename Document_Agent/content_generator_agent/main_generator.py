@@ -16,7 +16,7 @@ import sys
 import time
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Any, Tuple
+from typing import Dict, Any
 from datetime import datetime
 import logging
 
@@ -24,6 +24,7 @@ import logging
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from .simple_agent import SimpleContentGeneratorAgent
+from ..common.file_utils import read_json, write_json_atomic, write_text_atomic
 from clients.openrouter_client import OpenRouterClient
 from config.settings import setup_logging, get_concurrency_manager, SmartConcurrencyManager
 
@@ -119,8 +120,7 @@ class EnhancedMainDocumentGenerator:
             raise FileNotFoundError(f"文件不存在: {json_file_path}")
         
         # 2. 读取JSON
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
+        json_data = read_json(json_file_path)
         
         # 3. 并行生成内容（智能速率控制版）
         updated_json = self._generate_content_parallel_smart(json_data)
@@ -303,16 +303,14 @@ class EnhancedMainDocumentGenerator:
         
         # 保存JSON
         json_path = f"生成文档的依据_完成_{timestamp}.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(updated_json, f, ensure_ascii=False, indent=2)
+        write_json_atomic(json_path, updated_json)
         
         # 生成markdown
         full_md_path = f"完整版文档_{timestamp}.md"
         
         # 完整版
         full_content = self._convert_to_markdown(updated_json)
-        with open(full_md_path, 'w', encoding='utf-8') as f:
-            f.write(full_content)
+        write_text_atomic(full_md_path, full_content)
         
         # 统计信息
         stats = self._get_stats(updated_json)
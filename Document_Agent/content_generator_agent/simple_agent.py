@@ -8,10 +8,76 @@
 from typing import Dict, Any, List, Tuple, Optional
 import json
 import logging
-import datetime
 import re
 import time
 
+# _clean_content 使用的正则，模块加载时编译一次
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC_RE = re.compile(r'\*(.*?)\*')
+_HEADING_RE = re.compile(r'#{1,6}\s+')
+_CODE_BLOCK_RE = re.compile(r'```[\s\S]*?```')
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+_TRAILING_SPACES_RE = re.compile(r'[ \t]+\n')
+
+# 静态系统提示：每次调用保持字节级一致，便于模型服务端复用前缀缓存
+CONTENT_WRITER_SYSTEM_PROMPT = """
+请严格扮演一位专业的报告撰写人，根据用户提供的信息为一份将提交给政府主管部门和项目委托方的正式报告撰写其中一个章节。
+
+---
+**撰写要求与风格指引：**
+
+1.  **专业角色与语境**:
+    * **身份定位**: 你是持证的专业评估师，你的文字将成为官方报告的一部分。
+    * **写作目的**: 报告的核心是为项目审批提供清晰、可靠、专业的决策依据，而不是进行纯粹的学术研究或技术堆砌。
+    * **语言风格**: 语言必须专业、客观、严谨，但同时要保证清晰、易读，结论必须明确、直接。避免过度学术化的长篇论述。
+
+2.  **内容与结构**:
+    * **紧扣目标**: 严格围绕【本章写作目标与角色指引】展开，不要进行过度延伸。
+    * **数据使用**: 优先使用【核心参考资料】中提供的直接数据（如距离、高度、年代等）。对于复杂的分析过程，应直接引用其结论（例如，直接说"影响较弱"），而非在正文中详细推演计算过程。
+    * **结构化表达**:
+        * 采用清晰的层次结构，如"一、"、"（一）"、"1."来组织内容。
+
+3.  **格式规范 (严格遵守)**:
+    * **纯文本**: 全文使用纯文本格式，绝不包含任何Markdown标记（如`**`、`*`、`#`等）。
+    * **段落**: 段落之间用一个空行分隔。
+    * **序号**: 列表或子标题统一使用"（一）"、"1."、"（1）"等纯文本序号。
+    * **字数控制**: 正文内容控制在800-1200字之间。
+
+---
+**重要提示**:
+* 请直接生成正文内容，不要在开头或结尾添加任何额外说明或标题。
+* 最终输出的内容应该是一份可以直接嵌入正式报告的、成熟的章节正文。
+* 全文使用纯文本格式，绝不包含任何Markdown标记（如`**`、`*`、`#`等）。
+"""
+
+CONTENT_EVALUATOR_SYSTEM_PROMPT = """
+你是一位负责审核报告的资深主编，标准极高。你的任务是为用户提供的【待评估内容】进行全面的质量评估，并提供具体的改进建议。
+
+**评估维度与标准**:
+1.  **风格与专业性**: 内容是否是专业、务实的报告风格，而非学术探讨？
+2.  **结构与清晰度**: 结构是否清晰？关键部分是否有明确的总结？
+3.  **内容聚焦度**: 内容是否紧扣主题，没有过多无关细节？
+4.  **资料利用度**: 是否充分、准确地利用了参考资料？
+
+**【你的任务】**
+请根据上述标准，仔细审查【待评估内容】，并完成以下两项任务：
+1.  **综合评分**: 给出一个0到100之间的整数分数。
+2.  **具体反馈**: 如果内容存在问题，请提供详细、具体、可操作的改进建议。如果内容质量合格，则说明"内容质量良好，无需改进"。
+
+**请严格按照以下JSON格式返回你的评估结果：**
+```json
+{
+  "score": <0-100之间的整数>,
+  "feedback": "<详细的改进建议或评价>"
+}
+```
+
+注意：
+- 反馈要具体、可操作，指出需要修改的具体内容和方向
+- 不要只说有问题，要说明如何改进
+- 如果内容好，要明确说明好在哪里
+"""
+
 class SimpleContentGeneratorAgent:
     """
     简化版内容生成代理
@@ -61,8 +127,9 @@ class SimpleContentGeneratorAgent:
             # 3. 质量控制与改进循环
             for attempt in range(self.max_improvement_attempts + 1):
                 # 3.1. 评估当前内容质量并获取具体反馈
+                # 改进轮次的生成和评估prompt可能与上一轮完全相同，跳过响应缓存，避免拿回上一轮的结果
                 current_score, feedback = self._evaluate_content_quality(
-                    content, how_to_write, text_content
+                    content, how_to_write, text_content, use_cache=(attempt == 0)
                 )
                 
                 final_score, final_feedback = current_score, feedback
@@ -83,7 +150,8 @@ class SimpleContentGeneratorAgent:
                         subtitle=subtitle,
                         how_to_write=how_to_write,
                         retrieved_text_content=text_content,
-                        feedback=feedback
+                        feedback=feedback,
+                        use_cache=False
                     )
                 else:
                     self.logger.error(
@@ -125,7 +193,7 @@ class SimpleContentGeneratorAgent:
     
     def _generate_content_from_json_section(self, subtitle: str, 
                                               how_to_write: str, retrieved_text_content: str, 
-                                              feedback: Optional[str] = None) -> str:
+                                              feedback: Optional[str] = None, use_cache: bool = True) -> str:
         """
         根据JSON信息生成内容 (V4 - 基于文本内容生成)
         
@@ -134,12 +202,11 @@ class SimpleContentGeneratorAgent:
             how_to_write: 写作指导
             retrieved_text_content: 处理后的文本内容
             feedback: 评估反馈（如果是重新生成）
+            use_cache: 是否使用LLM响应缓存（改进轮次传False）
         """
         
-        # 统一的prompt模板，feedback为空时大模型会自动忽略
+        # 动态部分放在user消息中，静态的撰写规范见 CONTENT_WRITER_SYSTEM_PROMPT
         prompt = f"""
-请严格扮演一位专业的报告撰写人，根据以下信息为一份将提交给政府主管部门和项目委托方的正式报告撰写其中一个章节。
-
 【章节子标题】：{subtitle}
 
 【本章写作目标与角色指引】：
@@ -155,43 +222,17 @@ class SimpleContentGeneratorAgent:
 1. 仔细分析反馈中指出的具体问题
 2. 在撰写过程中逐一解决这些问题
 3. 确保最终内容符合专业报告的标准和要求
-
----
-**撰写要求与风格指引：**
-
-1.  **专业角色与语境**:
-    * **身份定位**: 你是持证的专业评估师，你的文字将成为官方报告的一部分。
-    * **写作目的**: 报告的核心是为项目审批提供清晰、可靠、专业的决策依据，而不是进行纯粹的学术研究或技术堆砌。
-    * **语言风格**: 语言必须专业、客观、严谨，但同时要保证清晰、易读，结论必须明确、直接。避免过度学术化的长篇论述。
-
-2.  **内容与结构**:
-    * **紧扣目标**: 严格围绕【本章写作目标与角色指引】展开，不要进行过度延伸。
-    * **数据使用**: 优先使用【核心参考资料】中提供的直接数据（如距离、高度、年代等）。对于复杂的分析过程，应直接引用其结论（例如，直接说"影响较弱"），而非在正文中详细推演计算过程。
-    * **结构化表达**:
-        * 采用清晰的层次结构，如"一、"、"（一）"、"1."来组织内容。
-
-3.  **格式规范 (严格遵守)**:
-    * **纯文本**: 全文使用纯文本格式，绝不包含任何Markdown标记（如`**`、`*`、`#`等）。
-    * **段落**: 段落之间用一个空行分隔。
-    * **序号**: 列表或子标题统一使用"（一）"、"1."、"（1）"等纯文本序号。
-    * **字数控制**: 正文内容控制在800-1200字之间。
-
----
-**重要提示**:
-* 请直接生成正文内容，不要在开头或结尾添加任何额外说明或标题。
-* 最终输出的内容应该是一份可以直接嵌入正式报告的、成熟的章节正文。
-* 全文使用纯文本格式，绝不包含任何Markdown标记（如`**`、`*`、`#`等）。    
 """
         
         try:
-            response = self.llm.generate(prompt)
+            response = self.llm.generate(prompt, system_prompt=CONTENT_WRITER_SYSTEM_PROMPT, use_cache=use_cache)
             return response.strip()
         except Exception as e:
             self.logger.error(f"LLM生成内容失败: {e}")
             return f"[内容生成失败: {str(e)}]"
     
     def _evaluate_content_quality(self, content: str, how_to_write: str, 
-                                    retrieved_text_content: str) -> Tuple[float, str]:
+                                    retrieved_text_content: str, use_cache: bool = True) -> Tuple[float, str]:
         """
         评估内容质量并返回具体反馈 (V4 - 基于文本内容评估)
         
@@ -210,15 +251,6 @@ class SimpleContentGeneratorAgent:
         # --- 阶段二：LLM 深度评估与反馈生成 ---
         
         evaluator_prompt = f"""
-你是一位负责审核报告的资深主编，标准极高。你的任务是为以下【待评估内容】进行全面的质量评估，并提供具体的改进建议。
-
-**评估维度与标准**:
-1.  **风格与专业性**: 内容是否是专业、务实的报告风格，而非学术探讨？
-2.  **结构与清晰度**: 结构是否清晰？关键部分是否有明确的总结？
-3.  **内容聚焦度**: 内容是否紧扣主题，没有过多无关细节？
-4.  **资料利用度**: 是否充分、准确地利用了参考资料？
-
----
 【本章写作指导】：
 {how_to_write}
 
@@ -227,35 +259,17 @@ class SimpleContentGeneratorAgent:
 
 【待评估内容】：
 {content}
----
-
-**【你的任务】**
-请根据上述标准，仔细审查【待评估内容】，并完成以下两项任务：
-1.  **综合评分**: 给出一个0到100之间的整数分数。
-2.  **具体反馈**: 如果内容存在问题，请提供详细、具体、可操作的改进建议。如果内容质量合格，则说明"内容质量良好，无需改进"。
-
-**请严格按照以下JSON格式返回你的评估结果：**
-```json
-{{
-  "score": <0-100之间的整数>,
-  "feedback": "<详细的改进建议或评价>"
-}}
-```
-
-注意：
-- 反馈要具体、可操作，指出需要修改的具体内容和方向
-- 不要只说有问题，要说明如何改进
-- 如果内容好，要明确说明好在哪里
 """
         
         try:
-            response_text = self.llm.generate(evaluator_prompt).strip()
-            # 确保只提取JSON部分
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if not json_match:
+            response_text = self.llm.generate(evaluator_prompt, system_prompt=CONTENT_EVALUATOR_SYSTEM_PROMPT,
+                                          use_cache=use_cache).strip()
+            # 确保只提取JSON部分：取第一个{到最后一个}之间的内容（与贪婪正则\{.*\}结果相同，但只需两次线性查找）
+            start, end = response_text.find('{'), response_text.rfind('}')
+            if start == -1 or end <= start:
                 raise json.JSONDecodeError("未在LLM响应中找到有效的JSON对象", response_text, 0)
             
-            eval_result = json.loads(json_match.group(0))
+            eval_result = json.loads(response_text[start:end + 1])
             
             score_int = eval_result.get("score", 0)
             feedback = eval_result.get("feedback", "评估结果解析异常")
@@ -283,13 +297,13 @@ class SimpleContentGeneratorAgent:
 
         # --- 以下是您原有的清理逻辑，保持不变 ---
         # 使用非贪婪匹配来避免错误替换
-        content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)  # 移除粗体
-        content = re.sub(r'\*(.*?)\*', r'\1', content)    # 移除斜体
-        content = re.sub(r'#{1,6}\s+', '', content)         # 移除标题标记
-        content = re.sub(r'```[\s\S]*?```', '', content) # 移除代码块
+        content = _BOLD_RE.sub(r'\1', content)             # 移除粗体
+        content = _ITALIC_RE.sub(r'\1', content)           # 移除斜体
+        content = _HEADING_RE.sub('', content)             # 移除标题标记
+        content = _CODE_BLOCK_RE.sub('', content)          # 移除代码块
         
-        content = re.sub(r'\n{3,}', '\n\n', content)      # 多个换行变成两个
-        content = re.sub(r'[ \t]+\n', '\n', content)      # 移除行尾空格
+        content = _EXTRA_NEWLINES_RE.sub('\n\n', content)  # 多个换行变成两个
+        content = _TRAILING_SPACES_RE.sub('\n', content)   # 移除行尾空格
         
         return content.strip()
     
@@ -327,19 +341,20 @@ class SimpleContentGeneratorAgent:
         Returns:
             str: 包含表格和图片的完整内容
         """
-        final_content = content
+        # 先收集片段再一次性拼接，避免每个表格/图片都复制一遍整段正文
+        parts = [content]
         
         # 添加表格 - 使用三级标题
         if retrieved_table:
-            final_content += "\n\n### 相关表格资料\n"
+            parts.append("\n\n### 相关表格资料\n")
             for i, table_item in enumerate(retrieved_table, 1):
                 table_content = table_item.get('content', str(table_item))
                 table_source = table_item.get('source', '未知来源')
-                final_content += f"\n**表格{i}** (来源: {table_source})\n\n{table_content}\n"
+                parts.append(f"\n**表格{i}** (来源: {table_source})\n\n{table_content}\n")
         
         # 添加图片 - 使用三级标题和markdown图片语法，并去重
         if retrieved_image:
-            final_content += "\n\n### 相关图片资料\n"
+            parts.append("\n\n### 相关图片资料\n")
             
             # 根据URL去重图片
             seen_urls = set()
@@ -359,8 +374,8 @@ class SimpleContentGeneratorAgent:
                 
                 # 使用标准markdown图片语法
                 if image_path and image_path != '无路径':
-                    final_content += f"\n![{image_desc}]({image_path})\n*图片来源: {image_source}*\n"
+                    parts.append(f"\n![{image_desc}]({image_path})\n*图片来源: {image_source}*\n")
                 else:
-                    final_content += f"\n**图片{i}** (来源: {image_source})  \n描述: {image_desc}  \n*路径未提供*\n"
+                    parts.append(f"\n**图片{i}** (来源: {image_source})  \n描述: {image_desc}  \n*路径未提供*\n")
         
-        return final_content
\ No newline at end of file
+        return "".join(parts)
\ No newline at end of file
@@ -11,6 +11,7 @@
 - 集成智能速率控制系统
 """
 
+import ast
 import json
 import sys
 import os
@@ -18,7 +19,7 @@ import time
 import logging
 import concurrent.futures
 import re
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional
 
 # 确保可以导入其他模块
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,6 +29,74 @@ sys.path.insert(0, project_root)
 from config.settings import get_concurrency_manager, SmartConcurrencyManager
 from clients.external_api_client import get_external_api_client
 
+# 从外部API/LLM响应中提取模板的正则，模块加载时编译一次
+_PY_DICT_TEMPLATE_PATTERN = re.compile(r"(\{'report_guide'.*?\})", re.DOTALL)
+_NESTED_DICT_TEMPLATE_PATTERN = re.compile(r"(\{[^{}]*'report_guide'[^{}]*\[[^\[\]]*\{[^{}]*\}[^\[\]]*\][^{}]*\})", re.DOTALL)
+_MARKDOWN_JSON_PATTERN = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL | re.IGNORECASE)
+
+# 只匹配花括号的正则：配平括号时由正则引擎在C层跳过普通字符，只在括号处回到Python
+_BRACE_PATTERN = re.compile(r'[{}]')
+
+# 默认写作指导模板：LLM失败或未覆盖某个子章节时使用，模块加载时构建一次
+DEFAULT_WRITING_GUIDE_TEMPLATE = "请围绕'{subtitle}'主题，结合项目实际情况详细描述相关内容。确保内容专业、准确、完整，符合该章节在整个文档中的作用和要求。"
+
+# 文档结构生成的提示词模板（模块级常量，所有实例与所有重试共用）
+STRUCTURE_PROMPT_TEMPLATE = """
+你是一个资深的专业文档结构设计专家。
+
+用户需求：{user_description}
+
+请为用户设计一个完整、专业的文档结构。你需要：
+1. 判断最适合的文档类型
+2. 设计合理的章节层级
+3. 确定每个章节和子章节的目标
+
+要求：
+- 结构完整、逻辑清晰
+- 体现项目特点和专业性
+- 章节设置要实用
+- 标题和子标题越多越好，尽可能详细和全面
+- 每个主要章节应包含多个子章节，覆盖所有相关方面
+- 必须按照指定的JSON格式返回
+- 返回纯文本格式，不要使用markdown语法
+
+请严格按照以下JSON格式返回：
+
+{{
+  "report_guide": [
+    {{
+      "title": "第一部分 章节标题",
+      "goal": "这个章节在整个文档中的作用和价值",
+      "sections": [
+        {{
+          "subtitle": "一、子章节标题"
+        }},
+        {{
+          "subtitle": "二、另一个子章节标题"
+        }}
+      ]
+    }},
+    {{
+      "title": "第二部分 另一个章节标题",
+      "goal": "另一个章节的目标",
+      "sections": [
+        {{
+          "subtitle": "一、子章节标题"
+        }}
+      ]
+    }}
+  ]
+}}
+
+注意：
+- 只返回JSON格式，不要其他解释
+- 不要包含how_to_write字段
+- title使用"第X部分"格式
+- subtitle使用"一、二、三、"格式
+- 专注于结构设计，不要写作指导内容
+"""
+
+
 class EnhancedOrchestratorAgent:
     """编排代理 - 集成智能速率控制系统"""
 
@@ -194,16 +263,13 @@ class EnhancedOrchestratorAgent:
             
             # 外部API返回格式可能包含说明文字，需要特殊处理
             # 查找Python字典格式的内容
-            import re
             
             # 方法1: 寻找以{'report_guide'开头的字典
-            dict_pattern = r"(\{'report_guide'.*?\})"
-            match = re.search(dict_pattern, template_content, re.DOTALL)
+            match = _PY_DICT_TEMPLATE_PATTERN.search(template_content)
             if match:
                 dict_content = match.group(1)
                 try:
                     # 使用ast.literal_eval来安全解析Python字典格式
-                    import ast
                     template = ast.literal_eval(dict_content)
                     if isinstance(template, dict) and 'report_guide' in template:
                         self.logger.info(f"✅ 成功解析模板（Python字典格式），包含 {len(template['report_guide'])} 个部分")
@@ -212,12 +278,10 @@ class EnhancedOrchestratorAgent:
                     self.logger.warning(f"Python字典解析失败: {e}")
             
             # 方法2: 查找完整的字典结构
-            brace_pattern = r"(\{[^{}]*'report_guide'[^{}]*\[[^\[\]]*\{[^{}]*\}[^\[\]]*\][^{}]*\})"
-            match = re.search(brace_pattern, template_content, re.DOTALL)
+            match = _NESTED_DICT_TEMPLATE_PATTERN.search(template_content)
             if match:
                 dict_content = match.group(1)
                 try:
-                    import ast
                     template = ast.literal_eval(dict_content)
                     if isinstance(template, dict) and 'report_guide' in template:
                         self.logger.info(f"✅ 成功解析模板（完整字典格式），包含 {len(template['report_guide'])} 个部分")
@@ -230,21 +294,20 @@ class EnhancedOrchestratorAgent:
                 # 寻找第一个{到最后一个}的内容
                 start_idx = template_content.find("{")
                 if start_idx != -1:
-                    # 找到匹配的}
+                    # 找到匹配的}（只遍历括号位置，不逐字符扫描）
                     brace_count = 0
                     end_idx = start_idx
-                    for i in range(start_idx, len(template_content)):
-                        if template_content[i] == '{':
+                    for brace in _BRACE_PATTERN.finditer(template_content, start_idx):
+                        if brace.group() == '{':
                             brace_count += 1
-                        elif template_content[i] == '}':
+                        else:
                             brace_count -= 1
                             if brace_count == 0:
-                                end_idx = i
+                                end_idx = brace.start()
                                 break
                     
                     if brace_count == 0:
                         dict_content = template_content[start_idx:end_idx + 1]
-                        import ast
                         template = ast.literal_eval(dict_content)
                         if isinstance(template, dict) and 'report_guide' in template:
                             self.logger.info(f"✅ 成功解析模板（宽松提取），包含 {len(template['report_guide'])} 个部分")
@@ -291,105 +354,13 @@ class EnhancedOrchestratorAgent:
             
             self.logger.info(f"正在处理RAG返回内容，长度: {len(content)} 字符")
             
-            # 尝试解析content为Python字典（如果它是字符串形式的字典）
-            if isinstance(content, str):
-                # 首先尝试用ast.literal_eval解析Python字典格式
-                try:
-                    import ast
-                    parsed_content = ast.literal_eval(content)
-                    self.logger.info(f"✅ 成功用ast.literal_eval解析内容")
-                    
-                    # 检查是否有final_answer结构
-                    if isinstance(parsed_content, dict) and 'final_answer' in parsed_content:
-                        final_answer = parsed_content['final_answer']
-                        if isinstance(final_answer, dict) and 'retrieved_text' in final_answer:
-                            retrieved_text = final_answer['retrieved_text']
-                            self.logger.info(f"找到retrieved_text，长度: {len(retrieved_text)} 字符")
-                            
-                            # retrieved_text可能是一个JSON字符串，需要再次解析
-                            if isinstance(retrieved_text, str):
-                                # 处理Python字典字符串格式（单引号转双引号）
-                                try:
-                                    # 尝试用eval解析Python字典格式
-                                    import ast
-                                    template = ast.literal_eval(retrieved_text)
-                                    if isinstance(template, dict) and 'report_guide' in template:
-                                        self.logger.info(f"✅ 成功提取模板，包含 {len(template['report_guide'])} 个部分")
-                                        return template
-                                except (ValueError, SyntaxError) as e:
-                                    self.logger.warning(f"ast.literal_eval 解析失败: {e}")
-                                
-                                # 如果ast失败，尝试手动转换单引号为双引号后用JSON解析
-                                try:
-                                    # 简单的单引号转双引号（可能不完美，但对于大多数情况有效）
-                                    json_text = retrieved_text.replace("'", '"')
-                                    template = json.loads(json_text)
-                                    if isinstance(template, dict) and 'report_guide' in template:
-                                        self.logger.info(f"✅ 成功提取模板（转换后），包含 {len(template['report_guide'])} 个部分")
-                                        return template
-                                except json.JSONDecodeError as e:
-                                    self.logger.warning(f"JSON转换解析失败: {e}")
-                            
-                            # 如果retrieved_text已经是字典
-                            elif isinstance(retrieved_text, dict) and 'report_guide' in retrieved_text:
-                                self.logger.info(f"✅ 成功提取模板（直接字典），包含 {len(retrieved_text['report_guide'])} 个部分")
-                                return retrieved_text
-                        
-                    # 检查是否直接包含report_guide
-                    elif isinstance(parsed_content, dict) and 'report_guide' in parsed_content:
-                        self.logger.info(f"✅ 成功提取模板（直接），包含 {len(parsed_content['report_guide'])} 个部分")
-                        return parsed_content
-                        
-                except (ValueError, SyntaxError) as e:
-                    self.logger.warning(f"ast.literal_eval解析失败: {e}")
-                    # 如果ast解析失败，尝试JSON解析
-                    try:
-                        parsed_content = json.loads(content)
-                        self.logger.info(f"✅ 成功用json.loads解析内容")
-                        
-                        # 检查是否有final_answer结构
-                        if isinstance(parsed_content, dict) and 'final_answer' in parsed_content:
-                            final_answer = parsed_content['final_answer']
-                            if isinstance(final_answer, dict) and 'retrieved_text' in final_answer:
-                                retrieved_text = final_answer['retrieved_text']
-                                self.logger.info(f"找到retrieved_text，长度: {len(retrieved_text)} 字符")
-                                
-                                # retrieved_text可能是一个JSON字符串，需要再次解析
-                                if isinstance(retrieved_text, str):
-                                    # 处理Python字典字符串格式（单引号转双引号）
-                                    try:
-                                        # 尝试用eval解析Python字典格式
-                                        import ast
-                                        template = ast.literal_eval(retrieved_text)
-                                        if isinstance(template, dict) and 'report_guide' in template:
-                                            self.logger.info(f"✅ 成功提取模板，包含 {len(template['report_guide'])} 个部分")
-                                            return template
-                                    except (ValueError, SyntaxError) as e:
-                                        self.logger.warning(f"ast.literal_eval 解析失败: {e}")
-                                    
-                                    # 如果ast失败，尝试手动转换单引号为双引号后用JSON解析
-                                    try:
-                                        # 简单的单引号转双引号（可能不完美，但对于大多数情况有效）
-                                        json_text = retrieved_text.replace("'", '"')
-                                        template = json.loads(json_text)
-                                        if isinstance(template, dict) and 'report_guide' in template:
-                                            self.logger.info(f"✅ 成功提取模板（转换后），包含 {len(template['report_guide'])} 个部分")
-                                            return template
-                                    except json.JSONDecodeError as e:
-                                        self.logger.warning(f"JSON转换解析失败: {e}")
-                                
-                                # 如果retrieved_text已经是字典
-                                elif isinstance(retrieved_text, dict) and 'report_guide' in retrieved_text:
-                                    self.logger.info(f"✅ 成功提取模板（直接字典），包含 {len(retrieved_text['report_guide'])} 个部分")
-                                    return retrieved_text
-                            
-                        # 检查是否直接包含report_guide
-                        elif isinstance(parsed_content, dict) and 'report_guide' in parsed_content:
-                            self.logger.info(f"✅ 成功提取模板（直接），包含 {len(parsed_content['report_guide'])} 个部分")
-                            return parsed_content
-                    except json.JSONDecodeError:
-                        # 如果JSON解析也失败，尝试其他方法
-                        pass
+            # 尝试解析content为字典：只有以{开头的内容才可能是字典字面量，其余直接走后备方案
+            if isinstance(content, str) and content.lstrip()[:1] == '{':
+                parsed_content = self._parse_dict_literal(content)
+                if parsed_content is not None:
+                    template = self._template_from_parsed_content(parsed_content)
+                    if template:
+                        return template
             
             # 使用原有的智能JSON提取作为后备方案
             try:
@@ -410,6 +381,82 @@ class EnhancedOrchestratorAgent:
             self.logger.error(traceback.format_exc())
             return None
 
+    def _parse_dict_literal(self, content: str) -> Optional[Any]:
+        """
+        将字符串解析为Python对象：先按Python字面量（单引号字典）解析，失败再按JSON解析
+        
+        Returns:
+            Optional[Any]: 解析结果，两种方式都失败时返回None
+        """
+        try:
+            parsed_content = ast.literal_eval(content)
+            self.logger.info(f"✅ 成功用ast.literal_eval解析内容")
+            return parsed_content
+        except (ValueError, SyntaxError) as e:
+            self.logger.warning(f"ast.literal_eval解析失败: {e}")
+        
+        try:
+            parsed_content = json.loads(content)
+            self.logger.info(f"✅ 成功用json.loads解析内容")
+            return parsed_content
+        except json.JSONDecodeError:
+            return None
+
+    def _template_from_parsed_content(self, parsed_content: Any) -> Optional[Dict[str, Any]]:
+        """
+        从解析后的RAG内容中取出模板：支持final_answer.retrieved_text嵌套结构，或直接包含report_guide
+        
+        Returns:
+            Optional[Dict[str, Any]]: 模板结构，未找到时返回None
+        """
+        if not isinstance(parsed_content, dict):
+            return None
+        
+        # 检查是否直接包含report_guide
+        if 'final_answer' not in parsed_content:
+            if 'report_guide' in parsed_content:
+                self.logger.info(f"✅ 成功提取模板（直接），包含 {len(parsed_content['report_guide'])} 个部分")
+                return parsed_content
+            return None
+        
+        # 检查是否有final_answer结构
+        final_answer = parsed_content['final_answer']
+        if not (isinstance(final_answer, dict) and 'retrieved_text' in final_answer):
+            return None
+        
+        retrieved_text = final_answer['retrieved_text']
+        self.logger.info(f"找到retrieved_text，长度: {len(retrieved_text)} 字符")
+        
+        # 如果retrieved_text已经是字典
+        if isinstance(retrieved_text, dict):
+            if 'report_guide' in retrieved_text:
+                self.logger.info(f"✅ 成功提取模板（直接字典），包含 {len(retrieved_text['report_guide'])} 个部分")
+                return retrieved_text
+            return None
+        
+        if not isinstance(retrieved_text, str):
+            return None
+        
+        # retrieved_text可能是Python字典字符串，优先用ast.literal_eval解析
+        try:
+            template = ast.literal_eval(retrieved_text)
+            if isinstance(template, dict) and 'report_guide' in template:
+                self.logger.info(f"✅ 成功提取模板，包含 {len(template['report_guide'])} 个部分")
+                return template
+        except (ValueError, SyntaxError) as e:
+            self.logger.warning(f"ast.literal_eval 解析失败: {e}")
+        
+        # 如果ast失败，尝试手动转换单引号为双引号后用JSON解析（可能不完美，但对于大多数情况有效）
+        try:
+            template = json.loads(retrieved_text.replace("'", '"'))
+            if isinstance(template, dict) and 'report_guide' in template:
+                self.logger.info(f"✅ 成功提取模板（转换后），包含 {len(template['report_guide'])} 个部分")
+                return template
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"JSON转换解析失败: {e}")
+        
+        return None
+
     def generate_document_structure(self, user_description: str, max_retries: int = 3) -> Dict[str, Any]:
         """
         生成文档基础结构 - 智能速率控制增强版
@@ -428,60 +475,8 @@ class EnhancedOrchestratorAgent:
         self.logger.info(f"开始生成文档基础结构（智能速率控制增强版）... (最大重试: {max_retries}次)")
         structure_start_time = time.time()
         
-        base_prompt = """
-你是一个资深的专业文档结构设计专家。
-
-用户需求：{user_description}
-
-请为用户设计一个完整、专业的文档结构。你需要：
-1. 判断最适合的文档类型
-2. 设计合理的章节层级
-3. 确定每个章节和子章节的目标
-
-要求：
-- 结构完整、逻辑清晰
-- 体现项目特点和专业性
-- 章节设置要实用
-- 标题和子标题越多越好，尽可能详细和全面
-- 每个主要章节应包含多个子章节，覆盖所有相关方面
-- 必须按照指定的JSON格式返回
-- 返回纯文本格式，不要使用markdown语法
-
-请严格按照以下JSON格式返回：
-
-{{
-  "report_guide": [
-    {{
-      "title": "第一部分 章节标题",
-      "goal": "这个章节在整个文档中的作用和价值",
-      "sections": [
-        {{
-          "subtitle": "一、子章节标题"
-        }},
-        {{
-          "subtitle": "二、另一个子章节标题"
-        }}
-      ]
-    }},
-    {{
-      "title": "第二部分 另一个章节标题",
-      "goal": "另一个章节的目标",
-      "sections": [
-        {{
-          "subtitle": "一、子章节标题"
-        }}
-      ]
-    }}
-  ]
-}}
-
-注意：
-- 只返回JSON格式，不要其他解释
-- 不要包含how_to_write字段
-- title使用"第X部分"格式
-- subtitle使用"一、二、三、"格式
-- 专注于结构设计，不要写作指导内容
-"""
+        # 用户需求在各次重试间不变，只填充一次模板
+        base_prompt = STRUCTURE_PROMPT_TEMPLATE.format(user_description=user_description)
         
         for attempt in range(max_retries):
             try:
@@ -493,7 +488,7 @@ class EnhancedOrchestratorAgent:
                         time.sleep(delay)
                 
                 # 构建prompt，重试时强调格式要求
-                prompt = base_prompt.format(user_description=user_description)
+                prompt = base_prompt
                 if attempt > 0:
                     prompt += f"\n\n⚠️ 重要提醒 (第{attempt + 1}次尝试)：请确保只返回纯JSON格式，不要包含任何说明文字或markdown标记！"
                 
@@ -627,21 +622,16 @@ class EnhancedOrchestratorAgent:
         if cleaned.startswith('{') and cleaned.endswith('}'):
             return cleaned
         
-        # 使用正则提取JSON内容
-        import re
-        
-        # 方法1: 寻找大括号包围的内容
-        json_pattern = r'(\{.*\})'
-        match = re.search(json_pattern, response, re.DOTALL)
-        if match:
-            json_content = match.group(1).strip()
+        # 方法1: 寻找大括号包围的内容（第一个{到最后一个}，与贪婪正则等价，但只需两次线性查找）
+        start_idx, end_idx = cleaned.find('{'), cleaned.rfind('}')
+        if start_idx != -1 and end_idx > start_idx:
+            json_content = cleaned[start_idx:end_idx + 1]
             # 简单验证是否像JSON
             if json_content.count('{') >= json_content.count('}') and '"report_guide"' in json_content:
                 return json_content
         
         # 方法2: 寻找markdown代码块中的JSON
-        markdown_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-        match = re.search(markdown_pattern, response, re.DOTALL | re.IGNORECASE)
+        match = _MARKDOWN_JSON_PATTERN.search(response)
         if match:
             return match.group(1).strip()
         
@@ -803,11 +793,9 @@ class EnhancedOrchestratorAgent:
         print(start_msg)  # 同时输出到控制台
         
         # 构建包含所有子章节的提示词
-        subtitles_list = []
-        for i, subsection in enumerate(subsections):
-            subtitles_list.append(f"{i+1}. {subsection.get('subtitle', '')}")
-        
-        subtitles_text = "\n".join(subtitles_list)
+        subtitles_text = "\n".join(
+            f"{i}. {subsection.get('subtitle', '')}" for i, subsection in enumerate(subsections, 1)
+        )
         
         prompt = f"""
 你是一个专业文档写作指导专家。
@@ -860,8 +848,17 @@ class EnhancedOrchestratorAgent:
                 self.logger.info(attempt_msg)
                 print(attempt_msg)
                 
-                response = self.llm_client.generate(prompt)
-                guides_data = json.loads(response.strip())
+                # 重试时提示词不变，需绕过响应缓存才能拿到新的生成结果
+                response = self.llm_client.generate(prompt, use_cache=(attempt == 0))
+                # 快速判断：直接以{开头的按原样解析；否则（如被```json包裹或带前后说明）截取首尾花括号之间的内容，
+                # 避免因为格式包装而白白浪费一次重试请求
+                text = response.strip()
+                if not text.startswith('{'):
+                    start, end = text.find('{'), text.rfind('}')
+                    if start == -1 or end <= start:
+                        raise json.JSONDecodeError("响应中未找到JSON对象", text, 0)
+                    text = text[start:end + 1]
+                guides_data = json.loads(text)
                 
                 # 将生成的写作指导应用到原始结构中
                 guides_dict = {}
@@ -877,7 +874,7 @@ class EnhancedOrchestratorAgent:
                         updated_count += 1
                     else:
                         # 如果没有找到对应的写作指导，使用默认内容
-                        subsection['how_to_write'] = f"请围绕'{subtitle}'主题，结合项目实际情况详细描述相关内容。确保内容专业、准确、完整，符合该章节在整个文档中的作用和要求。"
+                        subsection['how_to_write'] = DEFAULT_WRITING_GUIDE_TEMPLATE.format(subtitle=subtitle)
                 
                 success_msg = f"✅ [线程{section_num}] 成功生成 {updated_count}/{len(subsections)} 个子章节的写作指导"
                 self.logger.info(success_msg)
@@ -922,7 +919,7 @@ class EnhancedOrchestratorAgent:
         for subsection in section.get('sections', []):
             if 'how_to_write' not in subsection:
                 subtitle = subsection.get('subtitle', '')
-                subsection['how_to_write'] = f"请围绕'{subtitle}'主题，结合项目实际情况详细描述相关内容。确保内容专业、准确、完整，符合该章节在整个文档中的作用和要求。"
+                subsection['how_to_write'] = DEFAULT_WRITING_GUIDE_TEMPLATE.format(subtitle=subtitle)
 
     def _generate_single_how_to_write(self, subtitle: str, section_title: str, 
                                     section_goal: str, user_description: str) -> str:
@@ -970,7 +967,7 @@ class EnhancedOrchestratorAgent:
             return response.strip()
         except Exception as e:
             self.logger.warning(f"生成子章节写作指导失败: {e}")
-            return f"请围绕'{subtitle}'主题，结合项目实际情况详细描述相关内容。确保内容专业、准确、完整，符合该章节在整个文档中的作用和要求。"
+            return DEFAULT_WRITING_GUIDE_TEMPLATE.format(subtitle=subtitle)
 
     def _check_template_completeness(self, template: Dict[str, Any]) -> bool:
         """
@@ -6,14 +6,16 @@ ReAct Agent - 智能速率控制增强版
 """
 
 import json
+import contextlib
+import functools
 import logging
 import re
-import requests
 import sys
 import os
 import time
+import threading
 from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Set, Tuple
 import concurrent.futures
 
 # 添加项目路径以导入相关模块
@@ -22,6 +24,29 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from clients.external_api_client import get_external_api_client
 from config.settings import get_concurrency_manager, SmartConcurrencyManager
 
+# 从质量评估回复中提取0~1评分的正则，模块加载时编译一次
+_SCORE_PATTERN = re.compile(r'0?\.\d+|[01]')
+
+# 流式读取检索计划时，JSON闭合后最多再读取的字符数：余下内容不超过该值（如纯JSON回复只剩[DONE]）就读完，
+# 让连接正常结束并回到keep-alive连接池；超过则提前关闭流，不再等待模型追加的解释文字
+_PLAN_STREAM_DRAIN_LIMIT = 200
+
+# 检索规划与结果评估的静态指令放在系统提示中，每次调用字节一致，便于命中服务端的提示前缀缓存；
+# 章节、历史尝试和检索结果等动态内容只出现在用户消息里
+REACT_PLANNER_SYSTEM_PROMPT = """
+作为一名专业的信息检索分析师，为报告章节制定检索计划。
+【任务】: 1.分析现状。2.从可用策略中选择一个最佳策略。3.生成3-5个关键词。
+【输出格式】: 必须严格返回以下JSON格式:
+{
+  "analysis": "简要分析（100字内）",
+  "strategy": "选择的策略名称",
+  "keywords": "用逗号分隔的关键词"
+}"""
+
+REACT_EVALUATOR_SYSTEM_PROMPT = """
+评估用户提供的检索结果对章节写作的适用性。
+【要求】: 综合评估后，只返回一个0.0到1.0的小数评分。"""
+
 # ==============================================================================
 # 1. 数据结构与辅助类
 # ==============================================================================
@@ -35,6 +60,7 @@ class SectionInfo:
 class ReActState:
     iteration: int = 0
     attempted_queries: List[str] = field(default_factory=list)
+    used_strategies: Set[str] = field(default_factory=set)  # 已使用的策略，在记录查询时同步维护
     retrieved_results: List[Dict] = field(default_factory=list)
     quality_scores: List[float] = field(default_factory=list)
 
@@ -47,27 +73,51 @@ class ColoredLogger:
     
     def __init__(self, name: str):
         self.logger = logging.getLogger(name)
+        # 控制台日志输出到stdout；重定向到文件或管道时不写入ANSI颜色码（初始化时判断一次）
+        self.use_color = bool(getattr(sys.stdout, 'isatty', None) and sys.stdout.isatty())
     
     def _colorize(self, text: str, color: str) -> str:
+        if not self.use_color:
+            return text
         return f"{self.COLORS.get(color, '')}{text}{self.COLORS['RESET']}"
     
+    def _enabled(self) -> bool:
+        # INFO级别关闭时直接返回，省去消息拼接和着色
+        return self.logger.isEnabledFor(logging.INFO)
+    
     def info(self, message: str): self.logger.info(message)
     def error(self, message: str): self.logger.error(message)
     def warning(self, message: str): self.logger.warning(message)
     def debug(self, message: str): self.logger.debug(message)
-    def thought(self, content: str): self.logger.info(self._colorize(f"💭 Thought: {content}", 'BLUE'))
-    def input_tool(self, content: str): self.logger.info(self._colorize(f"🔧 Input: {content}", 'GREEN'))
-    def observation(self, content: str): self.logger.info(self._colorize(f"👁️ Observation: {content}", 'YELLOW'))
-    def reflection(self, content: str): self.logger.info(self._colorize(f"🤔 Reflection: {content}", 'CYAN'))
-    def section_start(self, title: str): self.logger.info(self._colorize(f"\n📝 开始处理章节: {title}", 'PURPLE'))
-    def section_complete(self, title: str, iterations: int, quality: float): self.logger.info(self._colorize(f"✅ 章节'{title}'完成 | 迭代{iterations}次 | 最终质量: {quality:.2f}", 'WHITE'))
-    def iteration(self, current: int, total: int): self.logger.info(self._colorize(f"🔄 [Iteration {current}/{total}]", 'CYAN'))
+    def thought(self, content: str):
+        if self._enabled(): self.logger.info(self._colorize(f"💭 Thought: {content}", 'BLUE'))
+    def input_tool(self, content: str):
+        if self._enabled(): self.logger.info(self._colorize(f"🔧 Input: {content}", 'GREEN'))
+    def observation(self, content: str):
+        if self._enabled(): self.logger.info(self._colorize(f"👁️ Observation: {content}", 'YELLOW'))
+    def reflection(self, content: str):
+        if self._enabled(): self.logger.info(self._colorize(f"🤔 Reflection: {content}", 'CYAN'))
+    def section_start(self, title: str):
+        if self._enabled(): self.logger.info(self._colorize(f"\n📝 开始处理章节: {title}", 'PURPLE'))
+    def section_complete(self, title: str, iterations: int, quality: float):
+        if self._enabled(): self.logger.info(self._colorize(f"✅ 章节'{title}'完成 | 迭代{iterations}次 | 最终质量: {quality:.2f}", 'WHITE'))
+    def iteration(self, current: int, total: int):
+        if self._enabled(): self.logger.info(self._colorize(f"🔄 [Iteration {current}/{total}]", 'CYAN'))
 
 # ==============================================================================
 # 2. 核心Agent类
 # ==============================================================================
 
 class EnhancedReactAgent:
+    # 检索策略说明：所有实例共享的常量，在类定义时构建一次
+    QUERY_STRATEGIES = {
+        'direct': "直接使用核心关键词搜索", 
+        'contextual': "结合写作指导上下文的详细查询", 
+        'semantic': "搜索与主题相关的语义概念", 
+        'specific': "搜索具体的案例、数据或技术标准",
+        'alternative': "使用同义词和相关概念进行发散搜索"
+    }
+
     def __init__(self, client: Any, concurrency_manager: SmartConcurrencyManager = None):
         self.client = client
         self.colored_logger = ColoredLogger(__name__)
@@ -96,14 +146,7 @@ class EnhancedReactAgent:
             'total_processing_time': 0.0,
             'avg_quality_score': 0.0
         }
-        
-        self.query_strategies = {
-            'direct': "直接使用核心关键词搜索", 
-            'contextual': "结合写作指导上下文的详细查询", 
-            'semantic': "搜索与主题相关的语义概念", 
-            'specific': "搜索具体的案例、数据或技术标准",
-            'alternative': "使用同义词和相关概念进行发散搜索"
-        }
+        self._stats_lock = threading.Lock()  # 统计计数会被多个工作线程同时更新
         
         status_msg = f"智能速率控制: {'已启用' if self.has_smart_control else '传统模式'}"
         self.colored_logger.info(f"EnhancedReactAgent 初始化完成，并发线程数: {self.max_workers}, {status_msg}")
@@ -132,7 +175,6 @@ class EnhancedReactAgent:
         """处理完整的报告指南 - 主入口 (并行处理)"""
         self.colored_logger.logger.info(f"🤖 ReAct开始并行处理报告指南... (项目: {project_name}, 线程数: {self.max_workers})")
         result_data = json.loads(json.dumps(report_guide_data))
-        self.current_project_name = project_name  # 存储项目名称供后续使用
         
         tasks = []
         for part in result_data.get('report_guide', []):
@@ -142,7 +184,7 @@ class EnhancedReactAgent:
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             future_to_section = {
-                executor.submit(self._process_section_with_react, section, part_context): section
+                executor.submit(self._process_section_with_react, section, part_context, project_name): section
                 for section, part_context in tasks
             }
             for future in concurrent.futures.as_completed(future_to_section):
@@ -167,14 +209,15 @@ class EnhancedReactAgent:
         self.colored_logger.logger.info("\n✅ 所有章节并行处理完成！")
         return result_data
 
-    def _process_section_with_react(self, section_data: dict, part_context: dict) -> str:
+    def _process_section_with_react(self, section_data: dict, part_context: dict, project_name: str = "医灵古庙") -> str:
         """为单个章节启动并管理ReAct处理流程。"""
         subtitle = section_data.get('subtitle', '')
         self.colored_logger.section_start(subtitle)
         state = ReActState()
         section_context = {
             'subtitle': subtitle, 'how_to_write': section_data.get('how_to_write', ''),
-            'part_title': part_context.get('title', ''), 'part_goal': part_context.get('goal', '')
+            'part_title': part_context.get('title', ''), 'part_goal': part_context.get('goal', ''),
+            'project_name': project_name
         }
         retrieved_content = self._react_loop_for_section(section_context, state)
         self.colored_logger.section_complete(subtitle, state.iteration, max(state.quality_scores) if state.quality_scores else 0)
@@ -182,58 +225,151 @@ class EnhancedReactAgent:
 
     def _react_loop_for_section(self, section_context: Dict[str, str], state: ReActState) -> str:
         """ReAct的核心循环"""
-        while state.iteration < self.max_iterations:
+        # 循环内反复使用的属性和绑定方法提前取为局部变量
+        log = self.colored_logger
+        max_iterations = self.max_iterations
+        reason_and_act = self._reason_and_act_for_section
+        observe = self._observe_section_results
+        attempted_queries, used_strategies = state.attempted_queries, state.used_strategies
+        retrieved_results, quality_scores = state.retrieved_results, state.quality_scores
+        
+        while state.iteration < max_iterations:
             state.iteration += 1
-            self.colored_logger.iteration(state.iteration, self.max_iterations)
+            log.iteration(state.iteration, max_iterations)
             
-            action_plan = self._reason_and_act_for_section(section_context, state)
+            action_plan = reason_and_act(section_context, state)
             if not action_plan or not action_plan.get('keywords'):
-                self.colored_logger.thought("未能生成有效的行动计划，提前结束。")
-                break
+                # 不再为格式错误额外请求一次LLM，直接用章节标题构造确定性的检索计划
+                action_plan = self._fallback_action_plan(section_context, state)
+                if not action_plan:
+                    log.thought("未能生成有效的行动计划，提前结束。")
+                    break
 
             reasoning, query, strategy = (action_plan.get('analysis'), action_plan.get('keywords'), action_plan.get('strategy'))
-            state.attempted_queries.append(f"{strategy}:{query}")
-            self.colored_logger.thought(reasoning)
-            self.colored_logger.input_tool(f"外部API搜索 | Strategy: {strategy} | Query: {query}")
+            attempted_queries.append(f"{strategy}:{query}")
+            used_strategies.add(strategy)
+            log.thought(reasoning)
+            log.input_tool(f"外部API搜索 | Strategy: {strategy} | Query: {query}")
             
-            results, quality_score = self._observe_section_results(query, section_context)
-            state.retrieved_results.extend(results)
-            state.quality_scores.append(quality_score)
-            self.colored_logger.observation(f"检索到 {len(results)} 条结果, 评估质量分: {quality_score:.2f}")
+            results, quality_score = observe(query, section_context)
+            retrieved_results.extend(results)
+            quality_scores.append(quality_score)
+            log.observation(f"检索到 {len(results)} 条结果, 评估质量分: {quality_score:.2f}")
             
             if not self._reflect(state, quality_score): break
                 
         return self._synthesize_retrieved_results(section_context, state)
 
+    def _fallback_action_plan(self, section_context: Dict[str, str], state: ReActState) -> Optional[Dict[str, str]]:
+        """LLM未给出有效计划时的确定性后备计划；同一关键词已检索过则返回None，避免重复检索"""
+        keywords = ",".join(k for k in (section_context.get('subtitle'), section_context.get('part_title')) if k)
+        if not keywords:
+            return None
+        # 检索只使用keywords，策略不影响检索结果，因此只按关键词判重（attempted_queries格式为"strategy:query"）
+        if any(q.split(":", 1)[1] == keywords for q in state.attempted_queries):
+            return None
+        # 这里选择策略仅用于日志和记录已用策略，并不会改变实际的检索请求
+        strategy = next((k for k in self.QUERY_STRATEGIES if k not in state.used_strategies), 'direct')
+        return {'analysis': "LLM未返回有效计划，使用章节标题作为后备检索关键词", 'strategy': strategy, 'keywords': keywords}
+
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def _available_strategies_json(cls, used_strategies: frozenset) -> str:
+        """可用策略的JSON描述（策略组合有限，按已用策略集合缓存序列化结果）"""
+        available_strategies = {k: v for k, v in cls.QUERY_STRATEGIES.items() if k not in used_strategies} or cls.QUERY_STRATEGIES
+        return json.dumps(available_strategies, ensure_ascii=False)
+
+    def _generate_action_plan_text(self, prompt: str) -> str:
+        """
+        生成检索计划文本：客户端支持流式输出时，截取到首个完整JSON对象的闭合括号为止；
+        之后的剩余内容较少时读完以复用连接，较多时提前关闭流，不再等待模型追加的解释文字；
+        流式失败或不支持时回退到普通generate
+        """
+        generate_stream = getattr(self.client, 'generate_stream', None)
+        if generate_stream is None:
+            return self.client.generate(prompt, system_prompt=REACT_PLANNER_SYSTEM_PROMPT)
+        
+        chunks = []
+        plan_text, drained = None, 0
+        depth, in_string, escaped, started = 0, False, False, False
+        try:
+            # closing保证提前返回时立即关闭生成器，触发generate_stream中的response.close()
+            with contextlib.closing(generate_stream(prompt, system_prompt=REACT_PLANNER_SYSTEM_PROMPT)) as stream:
+                for chunk in stream:
+                    if plan_text is not None:
+                        # JSON已完整，只读取少量剩余内容让连接正常结束；剩余过多则丢弃连接提前返回
+                        drained += len(chunk)
+                        if drained > _PLAN_STREAM_DRAIN_LIMIT:
+                            return plan_text
+                        continue
+                    chunks.append(chunk)
+                    for i, ch in enumerate(chunk):
+                        if in_string:
+                            if escaped:
+                                escaped = False
+                            elif ch == '\\':
+                                escaped = True
+                            elif ch == '"':
+                                in_string = False
+                        elif ch == '"':
+                            in_string = started
+                        elif ch == '{':
+                            depth += 1
+                            started = True
+                        elif ch == '}' and depth > 0:
+                            depth -= 1
+                            if depth == 0:
+                                # 只保留到闭合括号为止，同一数据块中括号之后的文字不计入计划文本
+                                chunks[-1] = chunk[:i + 1]
+                                plan_text = "".join(chunks)
+                                drained = len(chunk) - i - 1
+                                break
+                    if plan_text is not None and drained > _PLAN_STREAM_DRAIN_LIMIT:
+                        return plan_text
+            return plan_text if plan_text is not None else "".join(chunks)
+        except Exception as e:
+            if plan_text is not None:
+                return plan_text  # 计划已完整，读取剩余内容时出错不影响结果
+            self.colored_logger.warning(f"流式生成检索计划失败，回退到普通生成: {e}")
+            return self.client.generate(prompt, system_prompt=REACT_PLANNER_SYSTEM_PROMPT)
+
     def _reason_and_act_for_section(self, section_context: Dict[str, str], state: ReActState) -> Optional[Dict[str, str]]:
         """合并推理和行动阶段"""
-        used_strategies = {q.split(':')[0] for q in state.attempted_queries if ':' in q}
-        available_strategies = {k: v for k, v in self.query_strategies.items() if k not in used_strategies} or self.query_strategies
         prompt = f"""
-作为一名专业的信息检索分析师，为报告章节制定检索计划。
 【目标章节】: {section_context['subtitle']}
 【写作指导】: {section_context['how_to_write']}
 【历史尝试】: 已尝试查询: {state.attempted_queries[-3:]}, 历史质量: {state.quality_scores[-3:]}
-【可用策略】: {json.dumps(available_strategies, ensure_ascii=False)}
-【任务】: 1.分析现状。2.选择一个最佳策略。3.生成3-5个关键词。
-【输出格式】: 必须严格返回以下JSON格式:
-{{
-  "analysis": "简要分析（100字内）",
-  "strategy": "选择的策略名称",
-  "keywords": "用逗号分隔的关键词"
-}}"""
+【可用策略】: {self._available_strategies_json(frozenset(state.used_strategies))}"""
         try:
-            response_str = self.client.generate(prompt)
-            match = re.search(r'\{.*\}', response_str, re.DOTALL)
-            action_plan = json.loads(match.group(0))
-            if all(k in action_plan for k in ['analysis', 'strategy', 'keywords']):
-                return action_plan
-            self.colored_logger.error(f"LLM返回的JSON格式不完整: {action_plan}")
-            return None
+            response_str = (self._generate_action_plan_text(prompt) or "").strip()
         except Exception as e:
             self.colored_logger.error(f"推理与行动阶段出错: {e}")
             return None
 
+        # 快速路径：空响应或不含JSON对象时直接返回，不进入解析
+        if not response_str:
+            self.colored_logger.error("LLM返回空响应")
+            return None
+        start, end = response_str.find('{'), response_str.rfind('}')
+        if start == -1 or end <= start:
+            self.colored_logger.error(f"LLM响应中未找到JSON对象: {response_str[:100]}")
+            return None
+
+        try:
+            action_plan = json.loads(response_str[start:end + 1])
+        except json.JSONDecodeError as e:
+            self.colored_logger.error(f"LLM返回的JSON解析失败: {e}")
+            return None
+
+        if isinstance(action_plan, dict) and all(k in action_plan for k in ['analysis', 'strategy', 'keywords']):
+            # strategy会被加入used_strategies集合，非字符串（如列表）不可哈希，交由后备计划处理
+            if not isinstance(action_plan['strategy'], str):
+                self.colored_logger.error(f"LLM返回的strategy不是字符串: {action_plan['strategy']!r}")
+                return None
+            return action_plan
+        self.colored_logger.error(f"LLM返回的JSON格式不完整: {action_plan}")
+        return None
+
     def _observe_section_results(self, query: str, section_context: Dict[str, str]) -> Tuple[List[Dict], float]:
         """观察阶段（使用外部API进行文档搜索）"""
         query_start_time = time.time()
@@ -249,7 +385,7 @@ class EnhancedReactAgent:
             all_results = []
             
             # 记录外部API查询开始
-            self.react_stats['total_external_queries'] += 1
+            self._increment_stat('total_external_queries')
             
             # 执行外部API文档搜索
             api_start_time = time.time()
@@ -258,7 +394,7 @@ class EnhancedReactAgent:
             
             search_results = self.external_api.document_search(
                 query_text=combined_query,
-                project_name=getattr(self, 'current_project_name', '医灵古庙'),
+                project_name=section_context.get('project_name', '医灵古庙'),
                 top_k=5,
                 content_type="all"
             )
@@ -316,7 +452,7 @@ class EnhancedReactAgent:
                     success=True,
                     response_time=api_response_time
                 )
-            self.react_stats['successful_queries'] += 1
+            self._increment_stat('successful_queries')
             
             return all_results, quality_score
             
@@ -331,13 +467,18 @@ class EnhancedReactAgent:
                     response_time=query_response_time,
                     error_type=error_type
                 )
-            self.react_stats['failed_queries'] += 1
+            self._increment_stat('failed_queries')
             
             self.colored_logger.error(f"观察阶段失败: {e}")
             return [], 0.0
     
 
 
+    def _increment_stat(self, key: str, amount: int = 1):
+        """线程安全地累加统计计数"""
+        with self._stats_lock:
+            self.react_stats[key] += amount
+
     def _classify_react_error(self, error_message: str) -> str:
         """智能错误分类 - ReAct Agent专用"""
         error_msg = error_message.lower()
@@ -361,15 +502,13 @@ class EnhancedReactAgent:
         """评估结果质量"""
         if not results: return 0.0
         evaluation_prompt = f"""
-评估以下检索结果对章节写作的适用性：
 【目标章节】: {section_context['subtitle']}
 【写作指导】: {section_context['how_to_write']}
 【本次查询】: {query}
-【检索结果】: {chr(10).join(f"- {str(r.get('content', r))[:150]}..." for r in results[:3])}
-【要求】: 综合评估后，只返回一个0.0到1.0的小数评分。"""
+【检索结果】: {chr(10).join(f"- {str(r.get('content', r))[:150]}..." for r in results[:3])}"""
         try:
-            response = self.client.generate(evaluation_prompt)
-            score_match = re.search(r'0?\.\d+|[01]', response)
+            response = self.client.generate(evaluation_prompt, system_prompt=REACT_EVALUATOR_SYSTEM_PROMPT)
+            score_match = _SCORE_PATTERN.search(response)
             return max(0.0, min(1.0, float(score_match.group()))) if score_match else 0.2
         except Exception: return 0.1
 
@@ -400,8 +539,15 @@ class EnhancedReactAgent:
         retrieved_image = []
         retrieved_table = []
         
+        # 多轮检索常会重复命中同一段文本或同一张图片，按类型+路径/内容去重，保留首次出现的顺序
+        seen = set()
         for result in state.retrieved_results:
             result_type = result.get('type', 'text')
+            dedup_key = (result_type, result.get('path') or result.get('content'))
+            if dedup_key in seen:
+                continue
+            seen.add(dedup_key)
+            
             if result_type == 'text':
                 retrieved_text.append(result)
             elif result_type == 'image':
@@ -16,11 +16,13 @@ Gauz文档Agent - FastAPI服务器
 import sys
 import os
 import uuid
+import heapq
 import asyncio
 import logging
+from collections import deque
 from datetime import datetime
-from typing import Dict, Any, Optional, List
-from pathlib import Path
+from operator import itemgetter
+from typing import Deque, Dict, Any, Optional, List
 
 # 必须在所有其他导入之前禁用ChromaDB telemetry
 os.environ['ANONYMIZED_TELEMETRY'] = 'False'
@@ -29,17 +31,22 @@ os.environ['CHROMA_TELEMETRY_DISABLED'] = 'True'
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, status
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import uvicorn
 import json
 
+try:
+    import orjson  # 可选依赖：Rust实现的JSON序列化，速度明显快于标准库
+except ImportError:
+    orjson = None
+
 # 导入主要组件
 try:
     from main import DocumentGenerationPipeline
-    from config.settings import setup_logging, get_config
+    from config.settings import setup_logging
     from config.minio_config import get_minio_client, upload_document_files
 except ImportError as e:
     print(f"❌ 导入模块失败: {e}")
@@ -72,29 +79,41 @@ pipeline: Optional[DocumentGenerationPipeline] = None
 generation_tasks: Dict[str, Dict[str, Any]] = {}  # 存储任务状态
 file_storage: Dict[str, str] = {}  # 存储文件映射
 
+# ===== SSE编码 =====
+
+def _sse_event(payload: Dict[str, Any]) -> bytes:
+    """
+    将日志条目编码为一条UTF-8编码的SSE消息（优先使用orjson，缺失时回退到标准库json）
+    
+    直接返回bytes：orjson本身输出bytes，StreamingResponse也会把str再编码成bytes，
+    省去一次解码再编码的往返。
+    """
+    if orjson is not None:
+        return b"data: " + orjson.dumps(payload) + b"\n\n"
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
 # ===== 日志管理器 =====
 
 class LogManager:
     """任务日志管理器"""
     def __init__(self):
-        self.task_logs: Dict[str, List[Dict[str, Any]]] = {}  # 存储任务日志
+        self.task_logs: Dict[str, Deque[Dict[str, Any]]] = {}  # 存储任务日志
         self.log_subscribers: Dict[str, List[asyncio.Queue]] = {}  # 存储日志订阅者
         self.max_logs_per_task = 1000  # 每个任务最多保存的日志数量
+        self.log_retention_seconds = 3600  # 任务结束后日志保留时长（秒）
         
     def add_log(self, task_id: str, log_entry: Dict[str, Any]):
         """添加日志条目"""
-        if task_id not in self.task_logs:
-            self.task_logs[task_id] = []
+        task_logs = self.task_logs.get(task_id)
+        if task_logs is None:
+            # 限制日志数量，避免内存溢出：deque满后追加时自动丢弃最旧的条目
+            task_logs = self.task_logs[task_id] = deque(maxlen=self.max_logs_per_task)
         
         # 添加时间戳（如果没有的话）
         if 'timestamp' not in log_entry:
             log_entry['timestamp'] = datetime.now().isoformat()
             
-        self.task_logs[task_id].append(log_entry)
-        
-        # 限制日志数量，避免内存溢出
-        if len(self.task_logs[task_id]) > self.max_logs_per_task:
-            self.task_logs[task_id] = self.task_logs[task_id][-self.max_logs_per_task:]
+        task_logs.append(log_entry)
         
         # 推送给所有订阅者
         self._notify_subscribers(task_id, log_entry)
@@ -143,15 +162,19 @@ class LogManager:
                 pass  # 队列不在列表中
     
     def get_logs(self, task_id: str) -> List[Dict[str, Any]]:
-        """获取任务的所有日志"""
-        return self.task_logs.get(task_id, [])
+        """获取任务的所有日志（返回快照，调用方迭代时不受新日志追加影响）"""
+        return list(self.task_logs.get(task_id, ()))
     
     def cleanup_task_logs(self, task_id: str):
         """清理任务日志（任务完成后调用）"""
-        # 保留日志1小时，然后清理
+        # 保留日志1小时（供任务结束后查询），然后由事件循环定时清理，避免日志随任务数无限增长
         if task_id in self.task_logs:
-            # 这里可以实现延时清理，暂时保留
-            pass
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None  # 不在事件循环中调用时无法定时，保持原样保留
+            if loop is not None:
+                loop.call_later(self.log_retention_seconds, self.task_logs.pop, task_id, None)
         
         # 立即清理订阅者
         if task_id in self.log_subscribers:
@@ -255,11 +278,12 @@ async def shutdown_event():
     """关闭时清理资源"""
     logger.info("🔄 正在关闭Gauz文档Agent API服务...")
     
-    # 清理未完成的任务
+    # 清理未完成的任务（所有任务共用同一个取消时间）
+    cancelled_at = datetime.now()
     for task_id, task_info in generation_tasks.items():
         if task_info["status"] in ["pending", "running"]:
             task_info["status"] = "cancelled"
-            task_info["updated_at"] = datetime.now()
+            task_info["updated_at"] = cancelled_at
     
     logger.info("✅ 服务关闭完成")
 
@@ -293,27 +317,26 @@ async def stream_task_logs(task_id: str):
             # 首先发送历史日志
             historical_logs = log_manager.get_logs(task_id)
             for log_entry in historical_logs:
-                data = json.dumps(log_entry, ensure_ascii=False)
-                yield f"data: {data}\n\n"
+                yield _sse_event(log_entry)
             
             # 发送当前任务状态
+            task_info = generation_tasks[task_id]
+            task_status = task_info['status']
             task_status_log = {
                 "timestamp": datetime.now().isoformat(),
                 "type": "status",
-                "message": f"当前任务状态: {generation_tasks[task_id]['status']}",
-                "task_status": generation_tasks[task_id]['status'],
-                "progress": generation_tasks[task_id].get('progress', ''),
+                "message": f"当前任务状态: {task_status}",
+                "task_status": task_status,
+                "progress": task_info.get('progress', ''),
             }
-            data = json.dumps(task_status_log, ensure_ascii=False)
-            yield f"data: {data}\n\n"
+            yield _sse_event(task_status_log)
             
             # 实时推送新日志
             while True:
                 try:
                     # 等待新的日志条目，设置超时防止连接挂起
                     log_entry = await asyncio.wait_for(log_queue.get(), timeout=30.0)
-                    data = json.dumps(log_entry, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
+                    yield _sse_event(log_entry)
                     
                     # 如果任务已完成或失败，发送结束信号
                     if log_entry.get('type') in ['success', 'error'] or log_entry.get('step') == '任务完成':
@@ -324,8 +347,7 @@ async def stream_task_logs(task_id: str):
                             "type": "stream_end",
                             "message": "日志流结束"
                         }
-                        data = json.dumps(end_log, ensure_ascii=False)
-                        yield f"data: {data}\n\n"
+                        yield _sse_event(end_log)
                         break
                         
                 except asyncio.TimeoutError:
@@ -335,8 +357,7 @@ async def stream_task_logs(task_id: str):
                         "type": "heartbeat",
                         "message": "连接正常"
                     }
-                    data = json.dumps(heartbeat, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
+                    yield _sse_event(heartbeat)
                     
         except Exception as e:
             # 发送错误信息
@@ -345,8 +366,7 @@ async def stream_task_logs(task_id: str):
                 "type": "stream_error",
                 "message": f"日志流异常: {str(e)}"
             }
-            data = json.dumps(error_log, ensure_ascii=False)
-            yield f"data: {data}\n\n"
+            yield _sse_event(error_log)
             
         finally:
             # 清理订阅
@@ -372,14 +392,15 @@ async def get_task_logs(task_id: str):
     if task_id not in generation_tasks:
         raise HTTPException(status_code=404, detail=f"任务 {task_id} 不存在")
     
+    task_info = generation_tasks[task_id]
     logs = log_manager.get_logs(task_id)
     
     return {
         "task_id": task_id,
-        "task_status": generation_tasks[task_id]["status"],
+        "task_status": task_info["status"],
         "log_count": len(logs),
         "logs": logs,
-        "last_updated": generation_tasks[task_id]["updated_at"].isoformat()
+        "last_updated": task_info["updated_at"].isoformat()
     }
 
 @app.get("/status", response_model=SystemStatus)
@@ -447,14 +468,15 @@ async def generate_document(request: DocumentGenerationRequest, background_tasks
     
     # 生成任务ID
     task_id = str(uuid.uuid4())
+    now = datetime.now()
     
     # 创建任务记录
     task_info = {
         "task_id": task_id,
         "status": "pending",
         "progress": "任务已提交，等待处理",
-        "created_at": datetime.now(),
-        "updated_at": datetime.now(),
+        "created_at": now,
+        "updated_at": now,
         "request": request.dict(),
         "result": None,
         "error": None
@@ -502,11 +524,8 @@ async def list_tasks(limit: int = 20, status_filter: Optional[str] = None):
     if status_filter:
         tasks = [task for task in tasks if task["status"] == status_filter]
     
-    # 按时间排序，最新的在前
-    tasks.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    # 限制数量
-    tasks = tasks[:limit]
+    # 按时间取最新的limit个（等价于倒序排序后截断，但只维护大小为limit的堆）
+    tasks = heapq.nlargest(limit, tasks, key=itemgetter("created_at"))
     
     return {
         "total": len(generation_tasks),
@@ -605,13 +624,19 @@ async def run_document_generation(task_id: str, request: DocumentGenerationReque
             "generated_files": list(result_files.keys())
         })
         
-        # 生成本地文件下载链接
+        # 生成本地文件下载链接（顺带记录文件大小：一次stat同时完成存在性检查和取大小）
         file_links = {}
+        total_size_bytes = 0
         for file_type, file_path in result_files.items():
-            if file_type != 'output_directory' and os.path.exists(file_path):
-                file_id = str(uuid.uuid4())
-                file_storage[file_id] = file_path
-                file_links[file_type] = f"/download/{file_id}"
+            if file_type == 'output_directory':
+                continue
+            try:
+                total_size_bytes += os.path.getsize(file_path)
+            except OSError:
+                continue  # 文件不存在或不可访问
+            file_id = str(uuid.uuid4())
+            file_storage[file_id] = file_path
+            file_links[file_type] = f"/download/{file_id}"
         
         # 上传文件到MinIO
         task_info["progress"] = "正在上传文件到MinIO..."
@@ -628,7 +653,8 @@ async def run_document_generation(task_id: str, request: DocumentGenerationReque
         minio_urls = {}
         try:
             logger.info(f"📤 开始上传文件到MinIO: {task_id}")
-            minio_urls = upload_document_files(result_files, task_id)
+            # 上传是阻塞的网络I/O，放到线程池执行，避免阻塞事件循环（SSE日志推送等）
+            minio_urls = await loop.run_in_executor(None, upload_document_files, result_files, task_id)
             if minio_urls:
                 logger.info(f"✅ MinIO上传成功: {len(minio_urls)} 个文件")
                 log_manager.add_log(task_id, {
@@ -657,24 +683,22 @@ async def run_document_generation(task_id: str, request: DocumentGenerationReque
             })
         
         # 更新任务状态为完成
+        output_directory = result_files.get("output_directory")
+        completed_at = datetime.now()
         task_info["status"] = "completed"
         task_info["progress"] = "文档生成和上传完成"
         task_info["result"] = {
             "files": file_links,
             "minio_urls": minio_urls,
-            "output_directory": result_files.get("output_directory"),
-            "generation_time": datetime.now().isoformat(),
+            "output_directory": output_directory,
+            "generation_time": completed_at.isoformat(),
             "storage_info": {
                 "local_files": len(file_links),
                 "minio_files": len(minio_urls),
-                "total_size_mb": sum(
-                    os.path.getsize(file_path) / (1024 * 1024) 
-                    for file_path in result_files.values() 
-                    if file_path != result_files.get("output_directory") and os.path.exists(file_path)
-                )
+                "total_size_mb": total_size_bytes / (1024 * 1024)
             }
         }
-        task_info["updated_at"] = datetime.now()
+        task_info["updated_at"] = completed_at
         
         # 推送任务完成日志
         log_manager.add_log(task_id, {
@@ -5,14 +5,15 @@
 调用远程API服务，提供模板搜索和文档搜索功能
 """
 
-import json
 import time
 import logging
-import sys
 import os
 import aiohttp
 import asyncio
-from typing import Dict, List, Optional, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -51,6 +52,19 @@ class ExternalAPIClient:
         self.template_available = False
         self.document_available = False
         
+        # 可选的进程内LRU检索结果缓存（默认关闭）：同一文档内多个章节经常发出相同的检索，
+        # 索引不变时结果确定，命中即可省去一次远程调用；多个Agent线程共享同一客户端，需加锁
+        self._search_cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._search_cache_size = int(os.getenv("SEARCH_CACHE_SIZE", "0"))
+        self._search_cache_lock = threading.Lock()
+        
+        # 后台常驻事件循环与复用的HTTP会话（首次请求时创建）：
+        # 避免每次调用都asyncio.run新建事件循环、每次请求都新建ClientSession导致连接无法复用
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._session: Optional[aiohttp.ClientSession] = None
+        
         # 初始化并检查服务状态
         if self.skip_health_check:
             self.template_available = True
@@ -64,41 +78,66 @@ class ExternalAPIClient:
         self.logger.info(f"RAG检索服务: {self.rag_api_url} - {'可用' if self.document_available else '不可用'}")
     
     def _check_service_availability(self):
-        """检查服务可用性"""
+        """检查服务可用性（两个服务互不依赖，并行探测，初始化耗时取两者中较慢的一个）"""
         try:
             # 同步方式检查服务状态
             import requests
-            
-            # 检查模板搜索服务
-            try:
-                response = requests.options(f"{self.template_api_url}/template_search", timeout=5)
-                if response.status_code in [200, 405, 404]:
-                    self.template_available = True
-                    self.logger.info("✅ 模板搜索服务可达")
-            except Exception as e:
-                self.logger.warning(f"⚠️ 模板搜索服务检查失败: {e}")
-                # 即使检查失败，也假设服务可用，在实际调用时再处理错误
-                self.template_available = True
-                self.logger.info("🔄 假设模板搜索服务可用，将在调用时验证")
-            
-            # 检查RAG检索服务
-            try:
-                response = requests.options(f"{self.rag_api_url}/api/v1/search", timeout=5)
-                if response.status_code in [200, 405, 404]:
-                    self.document_available = True
-                    self.logger.info("✅ RAG检索服务可达")
-            except Exception as e:
-                self.logger.warning(f"⚠️ RAG检索服务检查失败: {e}")
-                # 即使检查失败，也假设服务可用
-                self.document_available = True
-                self.logger.info("🔄 假设RAG检索服务可用，将在调用时验证")
-                
         except ImportError:
             self.logger.error("❌ 缺少requests库，无法检查服务状态")
             # 如果没有requests库，直接假设服务可用
             self.template_available = True
             self.document_available = True
             self.logger.info("🔄 跳过服务检查，假设服务可用")
+            return
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # 检查模板搜索服务
+            template_future = executor.submit(
+                self._probe_service, requests, f"{self.template_api_url}/template_search", "模板搜索服务"
+            )
+            # 检查RAG检索服务
+            document_future = executor.submit(
+                self._probe_service, requests, f"{self.rag_api_url}/api/v1/search", "RAG检索服务"
+            )
+            if template_future.result():
+                self.template_available = True
+            if document_future.result():
+                self.document_available = True
+    
+    def _probe_service(self, requests_module, url: str, service_name: str) -> bool:
+        """探测单个服务是否可达；探测异常时也假设服务可用，在实际调用时再处理错误"""
+        try:
+            response = requests_module.options(url, timeout=5)
+            if response.status_code in [200, 405, 404]:
+                self.logger.info(f"✅ {service_name}可达")
+                return True
+            return False
+        except Exception as e:
+            self.logger.warning(f"⚠️ {service_name}检查失败: {e}")
+            self.logger.info(f"🔄 假设{service_name}可用，将在调用时验证")
+            return True
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """获取后台事件循环，首次调用时在守护线程中启动"""
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name="ExternalAPIClientLoop", daemon=True)
+                    thread.start()
+                    self._loop_thread = thread
+                    self._loop = loop
+        return self._loop
+    
+    def _run_sync(self, coro):
+        """在后台事件循环中执行协程并同步等待结果（多个Agent线程可同时调用）"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的HTTP会话；只在后台事件循环中调用，无需加锁"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
     
     async def _make_api_request(self, base_url: str, endpoint: str, data: dict, max_retries: int = 3) -> Optional[dict]:
         """
@@ -117,17 +156,16 @@ class ExternalAPIClient:
         
         for attempt in range(max_retries):
             try:
-                timeout = aiohttp.ClientTimeout(total=self.timeout)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.post(url, json=data) as response:
-                        if response.status == 200:
-                            return await response.json()
-                        else:
-                            error_text = await response.text()
-                            self.logger.error(f"❌ API请求失败 (状态码: {response.status}): {error_text}")
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(1 * (attempt + 1))  # 指数退避
-                            continue
+                session = await self._get_session()
+                async with session.post(url, json=data) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    else:
+                        error_text = await response.text()
+                        self.logger.error(f"❌ API请求失败 (状态码: {response.status}): {error_text}")
+                        if attempt < max_retries - 1:
+                            await asyncio.sleep(1 * (attempt + 1))  # 指数退避
+                        continue
                             
             except asyncio.TimeoutError:
                 self.logger.error(f"❌ API请求超时 (尝试 {attempt + 1}/{max_retries})")
@@ -140,6 +178,27 @@ class ExternalAPIClient:
         
         return None
     
+    def _get_cached_search(self, cache_key: Tuple) -> Optional[Any]:
+        """读取缓存的检索结果，命中时将其移到LRU队尾"""
+        with self._search_cache_lock:
+            result = self._search_cache.get(cache_key)
+            if result is not None:
+                self._search_cache.move_to_end(cache_key)
+            return result
+    
+    def _store_cached_search(self, cache_key: Tuple, result: Any):
+        """写入成功的检索结果，超出容量时淘汰最久未使用的条目"""
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = result
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > self._search_cache_size:
+                self._search_cache.popitem(last=False)
+    
+    def clear_search_cache(self):
+        """清空检索结果缓存（远程索引更新后调用）"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+    
     def check_service_status(self, force_refresh: bool = False) -> Dict[str, Any]:
         """检查服务状态"""
         if force_refresh:
@@ -179,8 +238,20 @@ class ExternalAPIClient:
             self.logger.error("❌ 模板搜索服务不可用")
             return None
         
-        # 使用同步方式调用异步函数
-        return asyncio.run(self._template_search_async(query, max_retries))
+        # 检索结果缓存：只缓存成功的结果，失败(None)不会进入缓存
+        cache_key = None
+        if self._search_cache_size > 0:
+            cache_key = ('template', query.strip())
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                self.logger.info(f"♻️ 命中模板搜索缓存: {query}")
+                return cached
+        
+        # 在后台事件循环中执行异步请求并同步等待
+        result = self._run_sync(self._template_search_async(query, max_retries))
+        if cache_key is not None and result:
+            self._store_cached_search(cache_key, result)
+        return result
     
     async def _template_search_async(self, query: str, max_retries: int = 3) -> Optional[str]:
         """异步模板搜索"""
@@ -230,8 +301,20 @@ class ExternalAPIClient:
             self.logger.error("❌ RAG检索服务不可用")
             return None
         
-        # 使用同步方式调用异步函数
-        return asyncio.run(self._document_search_async(query_text, project_name, top_k, content_type, max_retries))
+        # 检索结果缓存：只缓存成功的结果；缓存的字典在调用方之间共享，调用方只读不改
+        cache_key = None
+        if self._search_cache_size > 0:
+            cache_key = ('document', query_text.strip(), project_name, top_k, content_type)
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                self.logger.info(f"♻️ 命中RAG检索缓存: {query_text} (项目: {project_name})")
+                return cached
+        
+        # 在后台事件循环中执行异步请求并同步等待
+        result = self._run_sync(self._document_search_async(query_text, project_name, top_k, content_type, max_retries))
+        if cache_key is not None and result is not None:
+            self._store_cached_search(cache_key, result)
+        return result
     
     async def _document_search_async(self, query_text: str, project_name: str = "医灵古庙", 
                                    top_k: int = 5, content_type: str = "all", 
@@ -290,13 +373,14 @@ class ExternalAPIClient:
             
             # 处理图片结果 - 转换为Agent期望的字典格式
             formatted_images = []
+            scores = metadata.get('scores', [])  # 循环外取一次，不再每张图片查两次字典
             for i, image_url in enumerate(retrieved_images):
                 formatted_images.append({
                     'description': f'检索到的相关图片 {i+1}',
                     'source': 'RAG检索服务',
                     'type': 'image',
                     'path': image_url,
-                    'score': metadata.get('scores', [1.0])[i] if i < len(metadata.get('scores', [])) else 1.0
+                    'score': scores[i] if i < len(scores) else 1.0
                 })
             
             return {
@@ -323,8 +407,18 @@ class ExternalAPIClient:
         }
     
     def close(self):
-        """关闭客户端"""
-        self.logger.info("ExternalAPIClient 关闭（API客户端无需特殊清理）")
+        """关闭客户端：关闭复用的HTTP会话并停止后台事件循环"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+                self._session = None
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop_thread.join(timeout=5)
+            loop.close()
+            self._loop_thread = None
+        self.logger.info("ExternalAPIClient 已关闭")
 
 # 单例模式的全局客户端实例
 _global_external_client = None
@@ -6,13 +6,21 @@ import requests
 import json
 import logging
 import time
-import ssl
-from typing import Dict, Any, Optional
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, Optional
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from urllib3.exceptions import InsecureRequestWarning
 from config.settings import get_config
 
+try:
+    import orjson  # 可选依赖：流式响应每个数据块都要解析一次JSON，orjson可直接解析bytes且更快
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # 禁用SSL警告
 import urllib3
 urllib3.disable_warnings(InsecureRequestWarning)
@@ -42,6 +50,11 @@ class OpenRouterClient:
         # 创建会话并配置重试策略
         self.session = self._create_robust_session()
         
+        # 可选的进程内LRU响应缓存（多个Agent线程共享同一客户端，需加锁）
+        self._response_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._response_cache_size = self.config.get('response_cache_size', 0)
+        self._response_cache_lock = threading.Lock()
+        
     def _create_robust_session(self):
         """
         创建具有robust配置的请求会话
@@ -59,11 +72,12 @@ class OpenRouterClient:
             allowed_methods=["POST"],  # 允许重试的HTTP方法
         )
         
-        # 创建适配器
+        # 创建适配器：所有Agent线程共享同一个客户端，连接池需容纳全部并发线程，
+        # 才能让每次调用都复用已建立的keep-alive连接，而不是重新进行TCP+TLS握手
         adapter = HTTPAdapter(
             max_retries=retry_strategy,
             pool_connections=10,  # 连接池大小
-            pool_maxsize=10,  # 最大连接数
+            pool_maxsize=self.config.get('pool_maxsize', 10),  # 最大连接数
             pool_block=False  # 非阻塞
         )
         
@@ -76,8 +90,60 @@ class OpenRouterClient:
         
         return session
         
+    def _build_request_data(self, prompt: str, max_tokens: Optional[int],
+                            temperature: Optional[float], system_prompt: Optional[str]) -> Dict[str, Any]:
+        """
+        构建chat/completions请求体：静态的system消息在前，动态的user消息在后
+        """
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.append({'role': 'user', 'content': prompt})
+        
+        return {
+            'model': self.config['model'],
+            'messages': messages,
+            'max_tokens': max_tokens or self.config['max_tokens'],
+            'temperature': temperature or self.config['temperature']
+        }
+        
+    def _make_cache_key(self, data: Dict[str, Any]) -> str:
+        """
+        根据完整请求体（模型、消息、参数）计算缓存键
+        """
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+    
+    def _get_cached_response(self, cache_key: str) -> Optional[str]:
+        """
+        读取缓存的响应，命中时将其移到LRU队尾
+        """
+        with self._response_cache_lock:
+            content = self._response_cache.get(cache_key)
+            if content is not None:
+                self._response_cache.move_to_end(cache_key)
+            return content
+    
+    def _store_cached_response(self, cache_key: str, content: str):
+        """
+        写入成功的响应，超出容量时淘汰最久未使用的条目
+        """
+        with self._response_cache_lock:
+            self._response_cache[cache_key] = content
+            self._response_cache.move_to_end(cache_key)
+            while len(self._response_cache) > self._response_cache_size:
+                self._response_cache.popitem(last=False)
+    
+    def clear_response_cache(self):
+        """
+        清空响应缓存
+        """
+        with self._response_cache_lock:
+            self._response_cache.clear()
+        
     def generate(self, prompt: str, max_tokens: Optional[int] = None, 
-                temperature: Optional[float] = None, max_retries: int = 3) -> str:
+                temperature: Optional[float] = None, max_retries: int = 3,
+                system_prompt: Optional[str] = None, use_cache: bool = True) -> str:
         """
         生成文本 (增强版：支持SSL错误重试和更robust的错误处理)
         
@@ -86,23 +152,27 @@ class OpenRouterClient:
             max_tokens: 最大token数
             temperature: 温度参数
             max_retries: 最大重试次数
+            system_prompt: 静态系统提示（可选）。作为首条消息发送，
+                内容在多次调用间保持不变时可命中服务端的前缀缓存
+            use_cache: 是否使用响应缓存（仅在配置了response_cache_size时生效）。
+                因输出格式不合格而原样重试时应传False，避免再次拿到同一个结果
             
         Returns:
             str: 生成的文本
         """
         
         # 准备请求数据
-        data = {
-            'model': self.config['model'],
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'max_tokens': max_tokens or self.config['max_tokens'],
-            'temperature': temperature or self.config['temperature']
-        }
+        data = self._build_request_data(prompt, max_tokens, temperature, system_prompt)
+        
+        # 响应缓存：只缓存成功的结果，错误信息字符串不会进入缓存
+        cache_key = None
+        if self._response_cache_size > 0:
+            cache_key = self._make_cache_key(data)
+            if use_cache:
+                cached = self._get_cached_response(cache_key)
+                if cached is not None:
+                    self.logger.info("♻️ 命中OpenRouter响应缓存，跳过API调用")
+                    return cached
         
         self.logger.info(f"Sending request to OpenRouter: {self.config['model']}")
         
@@ -138,7 +208,8 @@ class OpenRouterClient:
                 # 解析响应
                 result = response.json()
                 
-                if 'choices' not in result or not result['choices']:
+                choices = result.get('choices')
+                if not choices:
                     self.logger.error(f"OpenRouter response format error: {result}")
                     if attempt < max_retries - 1:
                         time.sleep(2)
@@ -146,14 +217,16 @@ class OpenRouterClient:
                     else:
                         return "Response format error"
                 
-                content = result['choices'][0]['message']['content']
+                content = choices[0]['message']['content']
                 
                 # 记录使用情况
-                if 'usage' in result:
-                    usage = result['usage']
+                usage = result.get('usage')
+                if usage:
                     self.logger.info(f"Token usage: {usage}")
                 
                 self.logger.info(f"✅ OpenRouter API调用成功 (尝试 {attempt + 1}/{max_retries})")
+                if cache_key is not None and content:
+                    self._store_cached_response(cache_key, content)
                 return content
                 
             except requests.exceptions.SSLError as e:
@@ -231,6 +304,65 @@ class OpenRouterClient:
         # 如果所有重试都失败，返回错误信息
         return f"All {max_retries} attempts failed"
     
+    def generate_stream(self, prompt: str, max_tokens: Optional[int] = None,
+                        temperature: Optional[float] = None,
+                        system_prompt: Optional[str] = None) -> Iterator[str]:
+        """
+        流式生成文本，按到达顺序逐段产出模型输出
+        
+        与generate不同，这里不做重试，失败时直接抛出异常，由调用方决定是否回退到generate。
+        调用方提前停止迭代时会关闭连接，服务端随之停止生成。
+        
+        Args:
+            prompt: 输入提示
+            max_tokens: 最大token数
+            temperature: 温度参数
+            system_prompt: 静态系统提示（可选）
+            
+        Yields:
+            str: 模型输出的文本片段
+        """
+        data = self._build_request_data(prompt, max_tokens, temperature, system_prompt)
+        data['stream'] = True
+        
+        self.logger.info(f"Sending streaming request to OpenRouter: {self.config['model']}")
+        
+        response = self.session.post(
+            f"{self.config['base_url']}/chat/completions",
+            json=data,
+            timeout=(30, self.config['timeout']),  # 读取超时作用于相邻两个数据块之间
+            verify=True,
+            stream=True
+        )
+        
+        try:
+            if response.status_code != 200:
+                self.logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
+                response.raise_for_status()
+            
+            for raw_line in response.iter_lines():
+                # SSE格式：空行分隔事件，冒号开头的是注释（OpenRouter用它保活）
+                if not raw_line or not raw_line.startswith(b'data: '):
+                    continue
+                
+                # 直接在bytes上判断和解析，省去每个数据块的整行解码
+                payload = raw_line[6:]
+                if payload == b'[DONE]':
+                    break
+                
+                chunk = _json_loads(payload)
+                usage = chunk.get('usage')
+                if usage:
+                    self.logger.info(f"Token usage: {usage}")
+                
+                choices = chunk.get('choices')
+                if choices:
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+        finally:
+            response.close()
+    
     def test_connection(self) -> bool:
         """
         测试连接
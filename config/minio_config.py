@@ -7,9 +7,12 @@ MinIO对象存储配置和客户端
 """
 
 import os
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict
 from pathlib import Path
 
 from minio import Minio
@@ -40,6 +43,9 @@ class MinIOConfig:
         
         # 文件路径前缀
         self.path_prefix = os.getenv('MINIO_PATH_PREFIX', 'documents')
+        
+        # 可用性检查结果的缓存时间（秒），0表示每次都探测
+        self.availability_cache_seconds = float(os.getenv('MINIO_AVAILABILITY_CACHE_SECONDS', '30'))
 
 class MinIOClient:
     """MinIO客户端管理类"""
@@ -47,6 +53,7 @@ class MinIOClient:
     def __init__(self):
         self.config = MinIOConfig()
         self.client: Optional[Minio] = None
+        self._available_until = 0.0  # 可用性检查成功结果的有效期（monotonic时间）
         self._initialize_client()
     
     def _initialize_client(self):
@@ -96,12 +103,19 @@ class MinIOClient:
         if not self.client:
             return False
         
+        # 短时间内复用上一次成功的探测结果，避免每次上传/签名前都多一次网络往返
+        now = time.monotonic()
+        if now < self._available_until:
+            return True
+        
         try:
             # 尝试列出存储桶来测试连接
             self.client.bucket_exists(self.config.bucket_name)
+            self._available_until = now + self.config.availability_cache_seconds
             return True
         except Exception as e:
             logger.warning(f"⚠️ MinIO服务不可用: {e}")
+            self._available_until = 0.0
             return False
     
     def upload_file(self, file_path: str, object_name: Optional[str] = None) -> Optional[str]:
@@ -115,12 +129,13 @@ class MinIOClient:
         Returns:
             上传成功返回对象名称，失败返回None
         """
-        if not self.client or not self.is_available():
-            logger.error("❌ MinIO客户端不可用")
+        # 先检查本地文件，缺失的输入文件不应触发MinIO可用性探测，也不算作MinIO错误
+        if not os.path.exists(file_path):
+            logger.warning(f"⚠️ 文件不存在，跳过上传: {file_path}")
             return None
         
-        if not os.path.exists(file_path):
-            logger.error(f"❌ 文件不存在: {file_path}")
+        if not self.client or not self.is_available():
+            logger.error("❌ MinIO客户端不可用")
             return None
         
         try:
@@ -140,6 +155,10 @@ class MinIOClient:
             logger.info(f"✅ 文件上传成功: {object_name}")
             return object_name
             
+        except FileNotFoundError:
+            # 检查之后、上传之前文件被删除的情况
+            logger.warning(f"⚠️ 文件不存在，跳过上传: {file_path}")
+            return None
         except S3Error as e:
             logger.error(f"❌ 文件上传失败: {e}")
             return None
@@ -254,11 +273,17 @@ class MinIOClient:
             logger.error(f"❌ 列表操作异常: {e}")
             return []
 
-# 全局MinIO客户端实例
-minio_client = MinIOClient()
+# 全局MinIO客户端实例（首次使用时创建，导入本模块不会发起网络连接）
+minio_client: Optional[MinIOClient] = None
+_minio_client_lock = threading.Lock()
 
 def get_minio_client() -> MinIOClient:
     """获取全局MinIO客户端实例"""
+    global minio_client
+    if minio_client is None:
+        with _minio_client_lock:
+            if minio_client is None:
+                minio_client = MinIOClient()
     return minio_client
 
 def upload_document_files(file_paths: Dict[str, str], task_id: str) -> Dict[str, str]:
@@ -272,13 +297,11 @@ def upload_document_files(file_paths: Dict[str, str], task_id: str) -> Dict[str,
     Returns:
         文件类型到下载URL的映射
     """
-    client = get_minio_client()
     upload_results = {}
     
-    if not client.is_available():
-        logger.warning("⚠️ MinIO不可用，跳过文件上传")
-        return {}
-    
+    # 先收集待上传文件，再并发上传（每个文件的上传和签名URL都是阻塞的网络I/O）；
+    # 缺失的本地文件在创建客户端和探测MinIO之前就跳过
+    upload_jobs = []
     for file_type, file_path in file_paths.items():
         if file_type == 'output_directory':
             continue
@@ -290,15 +313,29 @@ def upload_document_files(file_paths: Dict[str, str], task_id: str) -> Dict[str,
         # 生成对象名称
         file_name = os.path.basename(file_path)
         object_name = f"documents/{task_id}/{file_type}_{file_name}"
-        
-        # 上传并获取URL
-        download_url = client.upload_and_get_url(file_path, object_name)
+        upload_jobs.append((file_type, file_path, object_name))
+    
+    if not upload_jobs:
+        return {}
+    
+    client = get_minio_client()
+    if not client.is_available():
+        logger.warning("⚠️ MinIO不可用，跳过文件上传")
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=min(len(upload_jobs), 4)) as executor:
+        # map保持提交顺序，结果字典的顺序与原串行实现一致
+        download_urls = list(executor.map(
+            lambda job: client.upload_and_get_url(job[1], job[2]), upload_jobs
+        ))
+    
+    for (file_type, file_path, _), download_url in zip(upload_jobs, download_urls):
         if download_url:
             upload_results[file_type] = download_url
             logger.info(f"📤 {file_type} 上传成功")
         else:
             logger.error(f"❌ {file_type} 上传失败: {file_path}")
+
+    logger.info(f"📊 批量上传完成: {len(upload_results)}/{len(upload_jobs)} 个文件成功")
     
-    logger.info(f"📊 批量上传完成: {len(upload_results)}/{len([k for k in file_paths.keys() if k != 'output_directory'])} 个文件成功")
-    
-    return upload_results 
\ No newline at end of file
+    return upload_results
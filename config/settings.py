@@ -3,7 +3,8 @@
 """
 
 import logging
-from typing import Dict, Any, Optional
+from threading import Lock
+from typing import Dict, Any
 import sys
 import os
 
@@ -19,7 +20,9 @@ SYSTEM_CONFIG = {
         'model': 'google/gemini-2.5-flash',
         'max_tokens': 10000,
         'temperature': 0.7,
-        'timeout': 30
+        'timeout': 30,
+        'pool_maxsize': 16,  # HTTP连接池大小，需不小于各Agent的max_workers，否则超出的连接用完即关闭、下次重新握手
+        'response_cache_size': 0  # 进程内响应缓存条数（LRU），0表示禁用；相同请求体直接返回上次成功的结果
     },
     
     # 日志配置
@@ -131,8 +134,8 @@ class SmartConcurrencyManager:
     
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or SYSTEM_CONFIG
-        from threading import Lock
         self._locks = {}  # 为每个Agent创建独立的锁
+        self._locks_guard = Lock()  # 保护锁的懒创建，避免并发时为同一Agent创建出多把锁
         self._rate_limiters = {}  # 存储各个Agent的智能速率控制器
         
         # 初始化智能速率控制器
@@ -233,15 +236,11 @@ class SmartConcurrencyManager:
             error_type_enum = None
             if error_type:
                 from common.advanced_rate_limiter import ErrorType
-                error_type_mapping = {
-                    'rate_limit': ErrorType.RATE_LIMIT,
-                    'server_error': ErrorType.SERVER_ERROR,
-                    'timeout': ErrorType.TIMEOUT,
-                    'network': ErrorType.NETWORK,
-                    'client_error': ErrorType.CLIENT_ERROR,
-                    'unknown': ErrorType.UNKNOWN
-                }
-                error_type_enum = error_type_mapping.get(error_type, ErrorType.UNKNOWN)
+                # 错误类型字符串即枚举值，直接按值查找，无需每次构建映射字典
+                try:
+                    error_type_enum = ErrorType(error_type)
+                except ValueError:
+                    error_type_enum = ErrorType.UNKNOWN
             
             rate_limiter.record_request(
                 success=success,
@@ -307,10 +306,11 @@ class SmartConcurrencyManager:
     
     def get_lock(self, agent_name: str):
         """获取指定Agent的线程锁"""
-        from threading import Lock
-        if agent_name not in self._locks:
-            self._locks[agent_name] = Lock()
-        return self._locks[agent_name]
+        lock = self._locks.get(agent_name)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(agent_name, Lock())
+        return lock
     
     def print_settings(self):
         """打印当前并发设置"""
@@ -372,8 +372,23 @@ def get_concurrency_manager() -> SmartConcurrencyManager:
     """获取智能并发管理器实例"""
     return SmartConcurrencyManager()
 
-def setup_logging():
-    """设置日志系统 - 支持UTF-8编码"""
+_logging_configured = False  # 日志系统是否已配置（进程内只需配置一次）
+
+def setup_logging(force: bool = False):
+    """
+    设置日志系统 - 支持UTF-8编码
+    
+    流水线、内容生成器和API服务都会调用本函数，重复调用时直接返回，
+    避免反复替换根日志记录器的handler（会关闭其他线程正在使用的handler，
+    配置了日志文件时还会重复打开文件）。
+    
+    Args:
+        force: 为True时无论是否已配置都重新配置
+    """
+    global _logging_configured
+    if _logging_configured and not force:
+        return
+    
     config = SYSTEM_CONFIG['logging']
     
     # 创建formatter
@@ -414,4 +429,6 @@ def setup_logging():
     
     # 设置第三方库日志级别
     logging.getLogger('urllib3').setLevel(logging.WARNING)
-    logging.getLogger('requests').setLevel(logging.WARNING) 
\ No newline at end of file
+    logging.getLogger('requests').setLevel(logging.WARNING)
+    
+    _logging_configured = True 
\ No newline at end of file
@@ -27,11 +27,10 @@ import os
 os.environ['ANONYMIZED_TELEMETRY'] = 'False'
 os.environ['CHROMA_TELEMETRY_DISABLED'] = 'True'
 
-import json
 import argparse
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict
 
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -42,7 +41,8 @@ try:
     from Document_Agent.orchestrator_agent import OrchestratorAgent
     from Document_Agent.section_writer_agent import ReactAgent
     from Document_Agent.content_generator_agent import MainDocumentGenerator
-    from config.settings import setup_logging, get_config, get_concurrency_manager
+    from config.settings import setup_logging, get_concurrency_manager
+    from Document_Agent.common.file_utils import write_json_atomic, write_text_atomic
 except ImportError as e:
     print(f"❌ 导入模块失败: {e}")
     print("请确保您在项目根目录下运行此程序，并安装了所有依赖。")
@@ -162,8 +162,7 @@ class DocumentGenerationPipeline:
             
             # 保存阶段1结果
             step1_file = os.path.join(output_dir, f"step1_document_guide_{timestamp}.json")
-            with open(step1_file, 'w', encoding='utf-8') as f:
-                json.dump(document_guide, f, ensure_ascii=False, indent=2)
+            write_json_atomic(step1_file, document_guide)
             
             # 阶段2：智能检索相关资料（SectionWriterAgent）
             print("\n🔍 阶段2：为各章节智能检索相关资料...")
@@ -178,8 +177,8 @@ class DocumentGenerationPipeline:
             
             # 保存阶段2结果
             step2_file = os.path.join(output_dir, f"step2_enriched_guide_{timestamp}.json")
-            with open(step2_file, 'w', encoding='utf-8') as f:
-                json.dump(enriched_guide, f, ensure_ascii=False, indent=2)
+            # 阶段2结果与阶段3输入内容相同，只序列化一次
+            enriched_guide_json = write_json_atomic(step2_file, enriched_guide)
             
             # 阶段3：生成最终文档（ContentGeneratorAgent）
             print("\n📝 阶段3：生成最终文档内容...")
@@ -187,8 +186,7 @@ class DocumentGenerationPipeline:
             
             # 保存为content_generator能识别的文件名
             generation_input = os.path.join(output_dir, f"生成文档的依据_{timestamp}.json")
-            with open(generation_input, 'w', encoding='utf-8') as f:
-                json.dump(enriched_guide, f, ensure_ascii=False, indent=2)
+            write_text_atomic(generation_input, enriched_guide_json)
             
             # 生成最终文档
             final_doc_path = self.content_generator.generate_document(generation_input)